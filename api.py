@@ -0,0 +1,449 @@
+# API JSON bất đồng bộ (chỉ dùng thư viện chuẩn) cho client di động và script:
+#
+#   python api.py --db finance.db --port 8080 --workers 8
+#
+# GET  /balance, /transactions, /categories, /summary, /budgets, /reminders, /goals, /metrics
+# POST /transactions   một object hoặc danh sách object {ngay, loai, danh_muc, so_tien, mo_ta[, ma_tham_chieu]}
+#                      ?on_duplicate=allow|skip|reject (mặc định allow, xem dedupe.py). Gửi lại an
+#                      toàn (idempotent) bằng skip, khi đó mỗi object phải có ma_tham_chieu
+#
+# Event loop chỉ đọc/ghi socket; mọi lệnh SQLite chạy trong ThreadPoolExecutor
+# giới hạn ``workers`` luồng. Phản hồi GET mang ETag theo data_version nên client
+# gửi If-None-Match nhận 304 mà không phải chạy lại truy vấn.
+import argparse
+import asyncio
+import json
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+import data_io
+import instrumentation
+from cache import LRUCache
+from database import Database
+from dedupe import DUPLICATE_POLICIES, DuplicateTransactionError
+
+DEFAULT_WORKERS = 8
+# Số yêu cầu đang chờ luồng tối đa; vượt quá trả 503 thay vì xếp hàng vô hạn
+MAX_PENDING = 1024
+BATCH_WINDOW_MS = 20
+BATCH_MAX_ROWS = 5000
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+KEEPALIVE_TIMEOUT = 15
+MAX_PAGE_SIZE = 500
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+               431: 'Request Header Fields Too Large', 500: 'Internal Server Error',
+               503: 'Service Unavailable'}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or {}
+
+
+def _json_default(value):
+    # Timestamp/date -> chuỗi ISO, số NumPy -> số Python
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'Không chuyển được sang JSON: {type(value).__name__}')
+
+
+def _records(df):
+    # DataFrame -> list dict, NaN/NaT thành null
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _int_param(params, name, default, maximum=None):
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ApiError(400, f'{name} phải là số nguyên')
+    return min(value, maximum) if maximum is not None else value
+
+
+def _cursor_param(params, name='after'):
+    # Con trỏ keyset dạng "a:b" (xem query_transactions, query_reminders)
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        first, second = value.split(':')
+        # Phần đầu rỗng: giao dịch không có ngày (xem query_transactions)
+        return int(first) if first else None, int(second)
+    except ValueError:
+        raise ApiError(400, f'{name} không hợp lệ')
+
+
+def _filters(params):
+    return {key: params[key] for key in ('loai', 'danh_muc', 'start', 'end') if params.get(key)}
+
+
+def get_balance(db, params):
+    totals = db.get_totals()
+    return {'balance': db.get_balance(), 'initial_balance': db.get_initial_balance(),
+            'income': totals['income'], 'expense': totals['expense'],
+            'transactions': db.get_transaction_count()}
+
+
+def get_transactions(db, params):
+    limit = _int_param(params, 'limit', 50, MAX_PAGE_SIZE)
+    filters = _filters(params)
+    text = params.get('q')
+    if text:
+        page, after = db.search_transactions(text, after=_int_param(params, 'after', 0),
+                                             limit=limit, **filters)
+        total = db.count_search_results(text, **filters)
+        next_cursor = str(after) if after is not None else None
+    else:
+        page, after = db.query_transactions(after=_cursor_param(params), limit=limit, **filters)
+        total = db.count_transactions(**filters)
+        next_cursor = f"{'' if after[0] is None else after[0]}:{after[1]}" if after is not None else None
+    page = page.assign(ngay=page['ngay'].dt.strftime('%Y-%m-%d'))
+    return {'items': _records(page), 'next': next_cursor, 'total': total}
+
+
+def get_categories(db, params):
+    return {'income': db.income_categories, 'expense': db.expense_categories,
+            'spending': db.get_category_summary()}
+
+
+def get_summary(db, params):
+    period = params.get('period', 'M')
+    if period not in ('M', 'Q', 'Y'):
+        raise ApiError(400, 'period phải là M, Q hoặc Y')
+    summary = db.get_period_summary(period)
+    return {'period': period, 'items': _records(summary.reset_index())}
+
+
+def get_budgets(db, params):
+    return {'items': _records(db.evaluate_budgets())}
+
+
+def get_reminders(db, params):
+    bucket = params.get('bucket', 'upcoming')
+    if bucket not in ('overdue', 'upcoming', 'later'):
+        raise ApiError(400, 'bucket phải là overdue, upcoming hoặc later')
+    within_days = _int_param(params, 'within_days', 7)
+    page, after = db.query_reminders(bucket, after=_cursor_param(params),
+                                     limit=_int_param(params, 'limit', 20, MAX_PAGE_SIZE),
+                                     within_days=within_days)
+    return {'items': _records(page), 'next': f'{after[0]}:{after[1]}' if after is not None else None,
+            'counts': db.count_reminders(within_days=within_days)}
+
+
+def get_goals(db, params):
+    # Kèm dự báo Monte Carlo: xác suất đạt đúng hạn và ngày đạt dự kiến (forecast.py)
+    return {'items': _records(db.forecast_saving_goals()), 'balance': db.get_balance()}
+
+
+ROUTES = {
+    '/balance': get_balance,
+    '/transactions': get_transactions,
+    '/categories': get_categories,
+    '/summary': get_summary,
+    '/budgets': get_budgets,
+    '/reminders': get_reminders,
+    '/goals': get_goals,
+}
+
+
+class TransactionBatcher:
+    """Gom các yêu cầu POST /transactions đến gần nhau thành một lần add_transactions.
+
+    Lô được đóng sau ``window_ms`` hoặc khi đủ ``max_rows`` dòng, rồi ghi trong
+    một giao dịch SQLite (một lần commit, một lần tăng data_version). Dòng
+    không hợp lệ chỉ làm hỏng yêu cầu chứa nó, không ảnh hưởng cả lô. Mỗi yêu
+    cầu mang chính sách trùng lặp của nó và được ghi sau các yêu cầu trước
+    trong lô (Database.add_transaction_groups), nên kết quả không phụ thuộc
+    việc hai yêu cầu rơi vào cùng một lô hay không.
+    """
+
+    def __init__(self, db, run_blocking, window_ms=BATCH_WINDOW_MS, max_rows=BATCH_MAX_ROWS,
+                 unknown_category='reject', on_write=None):
+        self.db = db
+        self.run_blocking = run_blocking
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self.unknown_category = unknown_category
+        self.on_write = on_write
+        self._queue = asyncio.Queue()
+        self.batches = 0
+        self.rows = 0
+
+    async def submit(self, records, on_duplicate='allow'):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(((records, on_duplicate), future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            rows = len(items[0][0][0])
+            deadline = loop.time() + self.window
+            while rows < self.max_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                rows += len(item[0][0])
+            try:
+                results = await self.run_blocking(self._write, [request for request, _ in items])
+            except Exception as e:
+                results = [e] * len(items)
+            if self.on_write is not None:
+                self.on_write()
+            for (_, future), result in zip(items, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _write(self, requests):
+        # Chạy trong thread pool: kiểm tra từng yêu cầu như khi nhập CSV rồi ghi cả lô,
+        # mỗi yêu cầu một nhóm theo chính sách trùng lặp của nó
+        resolver = data_io.CategoryResolver(self.db, self.unknown_category)
+        groups, results = [], []
+        for records, on_duplicate in requests:
+            try:
+                parsed = [data_io.parse_row({key: '' if value is None else str(value)
+                                             for key, value in record.items()}, resolver)
+                          for record in records]
+            except (ValueError, AttributeError) as e:
+                results.append(ApiError(400, str(e) if isinstance(e, ValueError) else 'Giao dịch phải là object'))
+                continue
+            if on_duplicate == 'skip' and any(row[5] is None for row in parsed):
+                # Không có mã tham chiếu thì hai lần mua giống hệt sẽ bị coi là một lần gửi lại
+                results.append(ApiError(400, f'on_duplicate=skip cần {data_io.REFERENCE_COLUMN} cho mọi giao dịch'))
+                continue
+            results.append(len(groups))
+            groups.append((parsed, on_duplicate))
+        resolver.flush()
+        if not groups:
+            return results
+        written = self.db.add_transaction_groups(groups)
+        self.batches += 1
+        self.rows += sum(count for count in written if not isinstance(count, Exception))
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                continue
+            count = written[result]
+            if isinstance(count, DuplicateTransactionError):
+                results[i] = ApiError(409, str(count), {'duplicates': count.duplicates})
+            else:
+                results[i] = {'inserted': count, 'duplicates': len(groups[result][0]) - count}
+        return results
+
+
+class ApiServer:
+    def __init__(self, db, workers=DEFAULT_WORKERS, max_pending=MAX_PENDING, **batch_options):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+        self.max_pending = max_pending
+        self.pending = 0
+        # Thân phản hồi đã mã hóa, theo đường dẫn + query và phiên bản dữ liệu
+        self.responses = LRUCache(max_entries=1024, max_bytes=32 * 1024 * 1024)
+        self._inflight = {}
+        self.batcher = TransactionBatcher(db, self.run_blocking, on_write=self._written, **batch_options)
+
+    async def run_blocking(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise ApiError(503, 'Máy chủ quá tải, thử lại sau')
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        batcher_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_HEADER_BYTES)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+            self.executor.shutdown(wait=True)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    writer.write(self._response(431, {'error': 'Header quá lớn'}, keep_alive=False))
+                    break
+                # Đường dẫn có thể chứa UTF-8 chưa mã hóa %; header theo chuẩn là latin-1
+                request_line, _, header_block = head.partition(b'\r\n')
+                request_line = request_line.decode('utf-8', 'replace')
+                header_lines = header_block.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ')
+                except ValueError:
+                    writer.write(self._response(400, {'error': 'Dòng yêu cầu không hợp lệ'}, keep_alive=False))
+                    break
+                headers = {}
+                for line in header_lines:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+
+                length = headers.get('content-length') or '0'
+                if not length.isdigit():
+                    writer.write(self._response(400, {'error': 'Content-Length không hợp lệ'}, keep_alive=False))
+                    break
+                length = int(length)
+                if length > MAX_BODY_BYTES:
+                    writer.write(self._response(413, {'error': 'Thân yêu cầu quá lớn'}, keep_alive=False))
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                writer.write(await self.dispatch(method, target, headers, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body, keep_alive=True):
+        path = urlsplit(target).path
+        name = f"api.{method} {path if path in ROUTES or path == '/metrics' else 'other'}"
+        with instrumentation.metrics.timed(name):
+            try:
+                return await self._dispatch(method, target, headers, body, keep_alive)
+            except ApiError as e:
+                return self._response(e.status, {'error': str(e), **e.details}, keep_alive=keep_alive)
+            except ValueError as e:
+                return self._response(400, {'error': str(e)}, keep_alive=keep_alive)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+                return self._response(500, {'error': 'Lỗi máy chủ'}, keep_alive=keep_alive)
+
+    async def _dispatch(self, method, target, headers, body, keep_alive):
+        url = urlsplit(target)
+        if url.path == '/metrics' and method == 'GET':
+            return self._response(200, self.metrics(), keep_alive=keep_alive)
+        if url.path == '/transactions' and method == 'POST':
+            try:
+                payload = json.loads(body or b'null')
+            except ValueError:
+                raise ApiError(400, 'Thân yêu cầu không phải JSON')
+            records = payload if isinstance(payload, list) else [payload]
+            on_duplicate = parse_qs(url.query).get('on_duplicate', ['allow'])[-1]
+            if on_duplicate not in DUPLICATE_POLICIES:
+                raise ApiError(400, f"on_duplicate phải là một trong {', '.join(DUPLICATE_POLICIES)}")
+            result = await self.batcher.submit(records, on_duplicate)
+            return self._response(200, result, keep_alive=keep_alive)
+        handler = ROUTES.get(url.path)
+        if handler is None:
+            raise ApiError(404, f'Không có đường dẫn {url.path}')
+        if method not in ('GET', 'HEAD'):
+            raise ApiError(405, f'{method} không được hỗ trợ cho {url.path}')
+
+        # Kết quả phụ thuộc dữ liệu và ngày hiện tại (ngân sách, nhắc nhở)
+        version = await self._shared(('data_version',), lambda: self.run_blocking(self.db.data_version))
+        etag = f'"{version}-{date.today().toordinal()}"'
+        if etag in headers.get('if-none-match', ''):
+            return self._response(304, None, etag=etag, keep_alive=keep_alive)
+        payload = self.responses.get(target, etag)
+        if payload is None:
+            payload = await self._shared((target, etag), lambda: self._render(handler, url, target, etag))
+        return self._response(200, payload, etag=etag, keep_alive=keep_alive,
+                              head_only=method == 'HEAD')
+
+    async def _shared(self, key, start):
+        # Các yêu cầu giống nhau đến cùng lúc chờ chung một lần chạy (single flight):
+        # sau mỗi lô ghi, hàng trăm client cùng hỏi một trang không làm truy vấn chạy hàng trăm lần
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(start())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is task else None)
+        return await asyncio.shield(task)
+
+    async def _render(self, handler, url, target, etag):
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        result = await self.run_blocking(handler, self.db, params)
+        payload = json.dumps(result, ensure_ascii=False, default=_json_default).encode('utf-8')
+        self.responses.set(target, etag, payload)
+        return payload
+
+    def _written(self):
+        # Lần đọc data_version đang chạy có thể bắt đầu trước lô vừa ghi: bỏ để
+        # client đọc ngay sau POST thấy dữ liệu của mình
+        self._inflight.pop(('data_version',), None)
+
+    def metrics(self):
+        snapshot = instrumentation.metrics.snapshot()
+        return {'requests': {name: {key: stat[key] for key in ('count', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms')}
+                             for name, stat in snapshot.items() if name.startswith('api.')},
+                'pending': self.pending, 'batches': self.batcher.batches,
+                'batched_rows': self.batcher.rows, 'response_cache': self.responses.stats()}
+
+    @staticmethod
+    def _response(status, payload, etag=None, keep_alive=True, head_only=False):
+        if payload is not None and not isinstance(payload, bytes):
+            payload = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+        body = payload or b''
+        lines = [f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}',
+                 'Content-Type: application/json; charset=utf-8',
+                 f'Content-Length: {len(body) if status != 304 else 0}',
+                 'Cache-Control: no-cache',
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if etag is not None:
+            lines.append(f'ETag: {etag}')
+        if status == 503:
+            lines.append('Retry-After: 1')
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        return head if status == 304 or head_only else head + body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='API JSON cho database tài chính')
+    parser.add_argument('--db', default='finance.db')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Số luồng chạy lệnh SQLite')
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW_MS,
+                        help='Thời gian gom các yêu cầu ghi thành một lô')
+    parser.add_argument('--unknown-category', choices=['add', 'other', 'reject'], default='reject')
+    args = parser.parse_args(argv)
+
+    db = Database(args.db, pool_size=args.workers + 1)
+    db.load_categories()
+    server = ApiServer(db, workers=args.workers, window_ms=args.batch_window_ms,
+                       unknown_category=args.unknown_category)
+    print(f'Đang phục vụ {args.db} tại http://{args.host}:{args.port}', file=sys.stderr)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
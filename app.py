@@ -1,20 +1,47 @@
+import time
+# Mốc bắt đầu script, trước các import nặng, để đo thời gian khởi động nguội
+script_started = time.perf_counter()
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import hashlib
-from database import Database
+import os
+import tempfile
+from cache import data_cache, figure_cache
+from scheduling import BUDGET_PERIODS, FREQUENCIES, RECURRENCES
+from sharding import get_router
+from instrumentation import dump as diagnostics_dump, metrics, query_log
+from dedupe import DuplicateTransactionError
+from data_io import EXPORT_FORMATS, available_export_formats, export_transactions, import_transactions_csv
+# utils chỉ import Plotly khi dựng biểu đồ, data_io chỉ import pyarrow khi xuất Parquet
 from utils import create_expense_by_category_chart, create_expense_trend_chart, format_currency
 
+# Mục tiêu thời gian từ lần chạy script đầu tiên của tiến trình tới khi trang đầu tiên hiển thị xong
+FIRST_RENDER_TARGET_MS = 1000
+
+
+@st.cache_resource
+def startup_state():
+    # Tài nguyên dùng chung mọi phiên: lần gọi đầu ghi lại mốc bắt đầu của tiến trình
+    return {'started': script_started, 'first_render_ms': None}
+
+
+def record_first_render():
+    startup = startup_state()
+    if startup['first_render_ms'] is None:
+        startup['first_render_ms'] = (time.perf_counter() - startup['started']) * 1000
+        metrics.record('app.first_render', startup['first_render_ms'])
+
+
+startup_state()
+
 # Thêm vào đầu file app.py
 primaryColor = "#2a9d8f"
 backgroundColor = "#f8f9fa"
 secondaryBackgroundColor = "#e9ecef"
 textColor = "#212529"
 
-# Khởi tạo session state
-if 'db' not in st.session_state:
-    st.session_state.db = Database()
-    st.session_state.db.load_categories()
+# Đo thời gian từng lần rerun và từng phần của script
+stop_rerun_timer = metrics.start('app.rerun')
 
 # Tiêu đề ứng dụng
 st.title('💰 Quản lý Tài chính Cá nhân')
@@ -88,8 +115,23 @@ with st.sidebar:
 
 if not st.session_state.authenticated:
     st.warning('Vui lòng đăng nhập để sử dụng ứng dụng')
+    record_first_render()
     st.stop()
 
+# Mỗi người dùng có database riêng khi đặt FINANCE_SHARD_DIR; nếu không, dùng chung finance.db.
+# FINANCE_WRITE_BEHIND=1: các phiên ghi qua một thread ghi chung cho mỗi file (group commit)
+with metrics.timed('app.setup'):
+    username = st.session_state.user_info['name']
+    shard_router = get_router(os.environ.get('FINANCE_SHARD_DIR'),
+                              write_behind=os.environ.get('FINANCE_WRITE_BEHIND') == '1')
+    if st.session_state.get('db_user') != username or 'db' not in st.session_state:
+        st.session_state.db = shard_router.get(username)
+        st.session_state.db_user = username
+    # Ghi các giao dịch định kỳ đã đến hạn, một lần cho mỗi phiên mỗi ngày
+    if st.session_state.get('recurring_day') != datetime.now().date():
+        st.session_state.db.materialize_recurring()
+        st.session_state.recurring_day = datetime.now().date()
+
 # --- Cấu trúc menu chính ---
 menu_options = {
     "🏠 Tổng quan": "overview",
@@ -128,12 +170,13 @@ with st.sidebar:
         selected_option = menu_options[selected_menu]
 
 # --- Main content dựa trên menu được chọn ---
-transactions = st.session_state.db.load_transactions()
-balance = st.session_state.db.get_balance()
-
+# Dữ liệu chỉ được đọc ở trang cần đến; Database cache kết quả theo data_version
+stop_page_timer = metrics.start(f'app.page.{selected_option}')
 if selected_option == "overview":
     # --- Trang tổng quan ---
     st.header('🏠 Tổng quan tài chính')
+    has_transactions = st.session_state.db.get_transaction_count() > 0
+    balance = st.session_state.db.get_balance()
 
     with st.expander("👤 Thông tin tài khoản"):
         st.write(f"**Người dùng:** {st.session_state.user_info['name']}")
@@ -141,24 +184,25 @@ if selected_option == "overview":
         st.write(f"**Ngày tham gia:** {datetime.now().strftime('%d/%m/%Y')}")
     
     # Hiển thị các chỉ số chính
+    totals = st.session_state.db.get_totals()
     col1, col2, col3 = st.columns(3)
     with col1:
         st.metric('Số dư hiện tại', format_currency(balance))
     with col2:
-        total_income = transactions[transactions['loai'] == 'Thu']['so_tien'].sum()
-        st.metric('Tổng thu nhập', format_currency(total_income))
+        st.metric('Tổng thu nhập', format_currency(totals['income']))
     with col3:
-        total_expense = transactions[transactions['loai'] == 'Chi']['so_tien'].sum()
-        st.metric('Tổng chi tiêu', format_currency(total_expense))
+        st.metric('Tổng chi tiêu', format_currency(totals['expense']))
     
     # Biểu đồ tổng quan
-    if not transactions.empty:
+    if has_transactions:
         st.subheader('📈 Biểu đồ chi tiêu tháng này')
         st.plotly_chart(create_expense_by_category_chart(st.session_state.db.get_category_summary()))
         
         st.subheader('📅 Lịch sử giao dịch gần đây')
+        # Trang đầu của truy vấn keyset: 5 giao dịch mới nhất, không đọc cả sổ cái
+        recent, _ = st.session_state.db.query_transactions(limit=5)
         st.dataframe(
-            transactions.head(5).rename(columns={
+            recent.rename(columns={
                 'ngay': 'Ngày',
                 'loai': 'Loại',
                 'danh_muc': 'Danh mục',
@@ -192,27 +236,92 @@ elif selected_option == "add_transaction":
         category = st.selectbox("Danh mục", categories)
         amount = st.number_input("Số tiền", min_value=0)
         description = st.text_input("Mô tả")
+        allow_duplicate = st.checkbox("Vẫn lưu nếu trùng giao dịch đã có")
         
         submitted = st.form_submit_button("💾 Lưu giao dịch")
     
     if submitted:
         try:
+            # Bấm lưu hai lần (hoặc nhập lại giao dịch cũ) bị chặn trừ khi người dùng xác nhận
             st.session_state.db.add_transaction(
                 date.strftime('%Y-%m-%d'),
                 trans_type,
                 category,
                 amount,
-                description
+                description,
+                on_duplicate='allow' if allow_duplicate else 'reject'
             )
             st.success("Giao dịch đã được lưu!")
+            # Chỉ kiểm tra ngân sách của danh mục vừa chi, trong kỳ chứa ngày giao dịch
+            alert = st.session_state.db.check_budget_alert(category, date, amount) if trans_type == "Chi" else None
+            if alert:
+                st.warning(f"Danh mục {alert['category']} đã dùng {alert['ratio']:.0%} ngân sách "
+                           f"{BUDGET_PERIODS[alert['period']].lower()} "
+                           f"({format_currency(alert['spent'])} / {format_currency(alert['amount'])})")
+        except DuplicateTransactionError:
+            st.warning("Đã có giao dịch giống hệt (cùng ngày, danh mục, số tiền và mô tả). "
+                       "Chọn \"Vẫn lưu nếu trùng\" nếu đây là một giao dịch khác.")
         except Exception as e:
             st.error(f"Lỗi: {str(e)}")
+    
+    # Giao dịch định kỳ (tiền nhà, lương, thuê bao...) được ghi tự động khi đến hạn
+    st.subheader('🔁 Giao dịch định kỳ')
+    with st.form("recurring_form"):
+        col1, col2 = st.columns(2)
+        with col1:
+            rule_name = st.text_input("Tên", placeholder="Tiền nhà")
+            rule_category = st.selectbox("Danh mục", categories, key="recurring_category")
+            rule_amount = st.number_input("Số tiền", min_value=0, key="recurring_amount")
+        with col2:
+            rule_frequency = st.selectbox("Tần suất", list(FREQUENCIES), index=2, format_func=FREQUENCIES.get)
+            rule_interval = st.number_input("Lặp mỗi (chu kỳ)", min_value=1, value=1)
+            rule_start = st.date_input("Bắt đầu", datetime.now(), key="recurring_start")
+        rule_end = st.date_input("Kết thúc (tùy chọn)", value=None, key="recurring_end")
+        
+        if st.form_submit_button("➕ Thêm giao dịch định kỳ"):
+            try:
+                st.session_state.db.add_recurring_rule(
+                    rule_name, trans_type, rule_category, rule_amount, rule_frequency, rule_start,
+                    interval=rule_interval, end_date=rule_end, description=rule_name)
+                added = st.session_state.db.materialize_recurring()
+                st.success(f"Đã thêm giao dịch định kỳ ({added} giao dịch đã đến hạn được ghi)")
+            except Exception as e:
+                st.error(f"Lỗi: {str(e)}")
+    
+    rules = st.session_state.db.get_recurring_rules()
+    if not rules.empty:
+        st.dataframe(
+            rules[['name', 'loai', 'danh_muc', 'so_tien', 'frequency', 'interval', 'next_date', 'end_date']].rename(columns={
+                'name': 'Tên',
+                'loai': 'Loại',
+                'danh_muc': 'Danh mục',
+                'so_tien': 'Số tiền',
+                'frequency': 'Tần suất',
+                'interval': 'Lặp mỗi',
+                'next_date': 'Lần tới',
+                'end_date': 'Kết thúc'
+            }),
+            hide_index=True,
+            use_container_width=True
+        )
+        # Dự kiến 30 ngày tới, tính trên bộ nhớ và không ghi vào database
+        today = datetime.now().date()
+        projected = st.session_state.db.project_recurring(
+            today + pd.Timedelta(days=1), today + pd.Timedelta(days=30))
+        if not projected.empty:
+            st.caption(f"30 ngày tới: {len(projected)} giao dịch định kỳ, "
+                       f"chi {format_currency(projected.loc[projected['loai'] == 'Chi', 'so_tien'].sum())}, "
+                       f"thu {format_currency(projected.loc[projected['loai'] == 'Thu', 'so_tien'].sum())}")
 
 elif selected_option == "view_transactions":
     # --- Xem lịch sử giao dịch ---
     st.header('📋 Lịch sử giao dịch')
     
-    if not transactions.empty:
+    if st.session_state.db.get_transaction_count() > 0:
+        # Sổ chỉ có giao dịch không có ngày thì MIN/MAX(ngay) là NULL
+        default_range = [pd.to_datetime(value).date() if value else datetime.now().date()
+                         for value in st.session_state.db.get_date_range()]
+        
         # Bộ lọc
         with st.expander("🔍 Bộ lọc"):
             col1, col2, col3 = st.columns(3)
@@ -221,22 +330,41 @@ elif selected_option == "view_transactions":
             with col2:
                 filter_category = st.selectbox('Danh mục', ['Tất cả'] + st.session_state.db.expense_categories + st.session_state.db.income_categories)
             with col3:
-                date_range = st.date_input('Khoảng thời gian', [transactions['ngay'].min(), transactions['ngay'].max()])
+                date_range = st.date_input('Khoảng thời gian', default_range)
+            # Tìm theo mô tả qua chỉ mục FTS5, không phân biệt dấu ("an uong" khớp "ăn uống")
+            search_text = st.text_input('Tìm trong mô tả', placeholder='Ví dụ: grab, an uong').strip()
         
-        # Áp dụng bộ lọc
-        filtered_transactions = transactions.copy()
-        if filter_type != 'Tất cả':
-            filtered_transactions = filtered_transactions[filtered_transactions['loai'] == filter_type]
-        if filter_category != 'Tất cả':
-            filtered_transactions = filtered_transactions[filtered_transactions['danh_muc'] == filter_category]
-        if len(date_range) == 2:
-            filtered_transactions = filtered_transactions[
-                (filtered_transactions['ngay'] >= pd.to_datetime(date_range[0])) & 
-                (filtered_transactions['ngay'] <= pd.to_datetime(date_range[1]))]
+        # Bộ lọc được chuyển thành truy vấn SQL có index. Khoảng ngày chỉ được lọc khi người
+        # dùng đổi khỏi mặc định: lọc theo ngày loại các giao dịch không có ngày (ngày cũ
+        # không đọc được khi migration), còn mặc định thì chúng được liệt kê ở cuối
+        date_filtered = len(date_range) == 2 and list(date_range) != default_range
+        history_filters = {
+            'loai': None if filter_type == 'Tất cả' else filter_type,
+            'danh_muc': None if filter_category == 'Tất cả' else filter_category,
+            'start': date_range[0] if date_filtered else None,
+            'end': date_range[1] if date_filtered else None
+        }
+        page_size = st.selectbox('Số dòng mỗi trang', [25, 50, 100, 200], index=1)
+        
+        # Con trỏ của các trang đã xem (keyset, hoặc offset khi tìm kiếm); đặt lại khi đổi bộ lọc
+        history_key = (tuple(history_filters.items()), search_text, page_size)
+        if st.session_state.get('history_key') != history_key:
+            st.session_state.history_key = history_key
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+        
+        if search_text:
+            page, next_cursor = st.session_state.db.search_transactions(
+                search_text, after=cursors[-1], limit=page_size, **history_filters)
+            total = st.session_state.db.count_search_results(search_text, **history_filters)
+        else:
+            page, next_cursor = st.session_state.db.query_transactions(
+                after=cursors[-1], limit=page_size, **history_filters)
+            total = st.session_state.db.count_transactions(**history_filters)
         
         # Hiển thị bảng
         st.dataframe(
-            filtered_transactions.rename(columns={
+            page.rename(columns={
                 'ngay': 'Ngày',
                 'loai': 'Loại',
                 'danh_muc': 'Danh mục',
@@ -248,13 +376,44 @@ elif selected_option == "view_transactions":
             height=500
         )
         
-        # Xuất báo cáo
-        st.download_button(
-            label="📥 Tải xuống CSV",
-            data=filtered_transactions.to_csv(index=False).encode('utf-8'),
-            file_name='bao_cao_giao_dich.csv',
-            mime='text/csv'
-        )
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button('◀ Trang trước', disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            total_pages = max(1, -(-total // page_size))
+            st.caption(f'Trang {len(cursors)} / {total_pages} — {total:,} giao dịch')
+        with col3:
+            if st.button('Trang sau ▶', disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
+        
+        # Xuất báo cáo: file chỉ được tạo khi người dùng yêu cầu, đọc từ SQLite theo từng khối
+        export_filters = history_filters
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            export_format = st.selectbox('Định dạng xuất', available_export_formats())
+        export_key = (tuple(export_filters.items()), export_format, st.session_state.db.data_version())
+        
+        if st.button('📦 Tạo file xuất'):
+            previous = st.session_state.get('export_file')
+            if previous and os.path.exists(previous['path']):
+                os.remove(previous['path'])
+            with tempfile.NamedTemporaryFile(suffix='.' + EXPORT_FORMATS[export_format][0], delete=False) as f:
+                export_transactions(st.session_state.db, f, export_format, **export_filters)
+            st.session_state.export_file = {'key': export_key, 'path': f.name}
+        
+        export_file = st.session_state.get('export_file')
+        if export_file and export_file['key'] == export_key and os.path.exists(export_file['path']):
+            extension, mime = EXPORT_FORMATS[export_format]
+            with open(export_file['path'], 'rb') as f:
+                st.download_button(
+                    label=f"📥 Tải xuống {export_format.upper()}",
+                    data=f,
+                    file_name=f'bao_cao_giao_dich.{extension}',
+                    mime=mime
+                )
     else:
         st.info('Chưa có giao dịch nào.')
 
@@ -262,7 +421,7 @@ elif selected_option == "expense_analysis":
     # --- Phân tích chi tiêu ---
     st.header('📊 Phân tích chi tiêu')
     
-    if not transactions.empty:
+    if st.session_state.db.get_transaction_count() > 0:
         tab1, tab2 = st.tabs(["Phân bổ chi tiêu", "Xu hướng chi tiêu"])
         
         with tab1:
@@ -271,19 +430,18 @@ elif selected_option == "expense_analysis":
         
         with tab2:
             st.subheader('Xu hướng chi tiêu theo thời gian')
-            st.plotly_chart(create_expense_trend_chart(transactions))
+            st.plotly_chart(create_expense_trend_chart(st.session_state.db.get_daily_expenses()))
             
             st.subheader('Phân tích theo chu kỳ')
             time_period = st.selectbox('Chọn khoảng thời gian', ['Theo tháng', 'Theo quý', 'Theo năm'])
             
             if time_period == 'Theo tháng':
-                transactions['period'] = transactions['ngay'].dt.to_period('M').astype(str)
+                period_summary = st.session_state.db.get_period_summary('M')
             elif time_period == 'Theo quý':
-                transactions['period'] = transactions['ngay'].dt.to_period('Q').astype(str)
+                period_summary = st.session_state.db.get_period_summary('Q')
             else:
-                transactions['period'] = transactions['ngay'].dt.to_period('Y').astype(str)
+                period_summary = st.session_state.db.get_period_summary('Y')
             
-            period_summary = transactions.groupby(['period', 'loai'])['so_tien'].sum().unstack().fillna(0)
             st.bar_chart(period_summary)
     else:
         st.info('Chưa có dữ liệu để phân tích.')
@@ -324,35 +482,36 @@ elif selected_option == "manage_budgets":
     
     # Thêm/Sửa ngân sách
     with st.form("budget_form"):
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
         with col1:
             budget_category = st.selectbox('Danh mục', st.session_state.db.expense_categories)
         with col2:
             budget_amount = st.number_input('Số tiền ngân sách', min_value=0)
+        with col3:
+            budget_period = st.selectbox('Kỳ', list(BUDGET_PERIODS), index=1, format_func=BUDGET_PERIODS.get)
         
         submitted = st.form_submit_button("💾 Lưu ngân sách")
         if submitted:
-            st.session_state.db.set_budget(budget_category, budget_amount)
-            st.success(f'Đã đặt ngân sách {budget_category}: {format_currency(budget_amount)}')
+            st.session_state.db.set_budget(budget_category, budget_amount, budget_period)
+            st.success(f'Đã đặt ngân sách {budget_category}: {format_currency(budget_amount)} '
+                       f'({BUDGET_PERIODS[budget_period].lower()})')
             st.rerun()
     
-    # Hiển thị ngân sách hiện tại
-    budgets = st.session_state.db.get_budgets()
-    if budgets:
+    # Chi tiêu trong kỳ hiện tại của mọi ngân sách, tính bằng một truy vấn trên bảng tổng hợp
+    budgets = st.session_state.db.evaluate_budgets()
+    if not budgets.empty:
         st.subheader('📊 Theo dõi ngân sách hiện tại')
-        expenses_by_category = st.session_state.db.get_category_summary()
         
-        for category, budget in budgets.items():
-            spent = expenses_by_category.get(category, 0)
-            progress = min(spent / budget * 100, 100) if budget > 0 else 0
+        for row in budgets.itertuples(index=False):
             col1, col2 = st.columns([1, 4])
             with col1:
-                st.write(f"**{category}**")
-                st.write(f"{format_currency(spent)} / {format_currency(budget)}")
+                st.write(f"**{row.category}**")
+                st.write(f"{format_currency(row.spent)} / {format_currency(row.amount)}")
+                st.caption(f"{BUDGET_PERIODS[row.period]}: {row.period_start} → {row.period_end}")
             with col2:
-                st.progress(int(progress))
-                if spent > budget:
-                    st.warning(f"Vượt ngân sách {format_currency(spent - budget)}")
+                st.progress(int(min(row.ratio, 1) * 100))
+                if row.status == 'over':
+                    st.warning(f"Vượt ngân sách {format_currency(-row.remaining)}")
 
 elif selected_option == "payment_reminders":
     # --- Nhắc nhở thanh toán ---
@@ -366,11 +525,13 @@ elif selected_option == "payment_reminders":
         with col2:
             reminder_date = st.date_input('Ngày đến hạn')
         
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
         with col1:
             reminder_amount = st.number_input('Số tiền', min_value=0)
         with col2:
             reminder_category = st.selectbox('Danh mục', st.session_state.db.expense_categories)
+        with col3:
+            reminder_recurrence = st.selectbox('Lặp lại', list(RECURRENCES), format_func=RECURRENCES.get)
         
         submitted = st.form_submit_button("➕ Thêm nhắc nhở")
         if submitted:
@@ -378,27 +539,52 @@ elif selected_option == "payment_reminders":
                 reminder_name,
                 reminder_date.strftime('%Y-%m-%d'),
                 reminder_amount,
-                reminder_category
+                reminder_category,
+                reminder_recurrence
             )
             st.success('Đã thêm nhắc nhở!')
             st.rerun()
     
-    # Hiển thị danh sách nhắc nhở
-    reminders = st.session_state.db.get_reminders()
-    if not reminders.empty:
+    # Danh sách nhắc nhở theo nhóm, mỗi nhóm một truy vấn có index và phân trang keyset
+    reminder_counts = st.session_state.db.count_reminders()
+    if sum(reminder_counts.values()) > 0:
         st.subheader('📋 Danh sách nhắc nhở')
-        today = datetime.now().date()
+        reminder_groups = [
+            ('overdue', '🔴 Quá hạn', st.error),
+            ('upcoming', '🟠 Sắp đến hạn (7 ngày)', st.warning),
+            ('later', '🔵 Sau 7 ngày', st.info),
+        ]
+        if st.session_state.get('reminder_version') != st.session_state.db.data_version():
+            st.session_state.reminder_version = st.session_state.db.data_version()
+            st.session_state.reminder_cursors = {bucket: [None] for bucket, _, _ in reminder_groups}
         
-        for _, row in reminders.iterrows():
-            due_date = datetime.strptime(row['due_date'], '%Y-%m-%d').date()
-            days_left = (due_date - today).days
-            
-            if days_left < 0:
-                st.error(f"**QUÁ HẠN**: {row['name']} - {format_currency(row['amount'])} - {row['category']} (Quá hạn {abs(days_left)} ngày)")
-            elif days_left <= 7:
-                st.warning(f"**SẮP ĐẾN HẠN**: {row['name']} - {format_currency(row['amount'])} - {row['category']} (Còn {days_left} ngày)")
-            else:
-                st.info(f"{row['name']} - {format_currency(row['amount'])} - {row['category']} (Còn {days_left} ngày)")
+        tabs = st.tabs([f'{label} ({reminder_counts[bucket]})' for bucket, label, _ in reminder_groups])
+        for tab, (bucket, label, show) in zip(tabs, reminder_groups):
+            with tab:
+                cursors = st.session_state.reminder_cursors[bucket]
+                page, next_cursor = st.session_state.db.query_reminders(
+                    bucket, after=cursors[-1], limit=20)
+                for row in page.itertuples(index=False):
+                    repeat = '' if row.recurrence == 'none' else f" — {RECURRENCES[row.recurrence]}"
+                    if row.days_left < 0:
+                        show(f"**QUÁ HẠN**: {row.name} - {format_currency(row.amount)} - {row.category} "
+                             f"(Quá hạn {abs(row.days_left)} ngày){repeat}")
+                    elif bucket == 'upcoming':
+                        show(f"**SẮP ĐẾN HẠN**: {row.name} - {format_currency(row.amount)} - {row.category} "
+                             f"({row.due_date}, còn {row.days_left} ngày){repeat}")
+                    else:
+                        show(f"{row.name} - {format_currency(row.amount)} - {row.category} "
+                             f"({row.due_date}, còn {row.days_left} ngày){repeat}")
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button('◀ Trước', key=f'reminders_prev_{bucket}', disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with col2:
+                    if st.button('Sau ▶', key=f'reminders_next_{bucket}', disabled=next_cursor is None):
+                        cursors.append(next_cursor)
+                        st.rerun()
 
 elif selected_option == "saving_goals":
     # --- Mục tiêu tiết kiệm ---
@@ -425,7 +611,8 @@ elif selected_option == "saving_goals":
             st.rerun()
     
     # Hiển thị danh sách mục tiêu
-    goals = st.session_state.db.get_saving_goals()
+    # Số dư được dành lần lượt cho các mục tiêu theo hạn; dự báo Monte Carlo cache theo data_version
+    goals = st.session_state.db.forecast_saving_goals()
     if not goals.empty:
         st.subheader('📋 Danh sách mục tiêu')
         today = datetime.now().date()
@@ -433,16 +620,22 @@ elif selected_option == "saving_goals":
         for _, row in goals.iterrows():
             target_date = datetime.strptime(row['target_date'], '%Y-%m-%d').date()
             days_left = (target_date - today).days
-            progress = min(balance / row['amount'] * 100, 100)
+            progress = max(0, min(row['funded'] / row['amount'] * 100, 100)) if row['amount'] else 100
             
             st.subheader(row['name'])
             st.progress(int(progress))
-            st.write(f"{format_currency(balance)} / {format_currency(row['amount'])} ({progress:.1f}%)")
+            st.write(f"{format_currency(row['funded'])} / {format_currency(row['amount'])} ({progress:.1f}%)")
             st.write(f"⏳ Còn {days_left} ngày để hoàn thành")
             
-            if balance >= row['amount']:
+            if row['funded'] >= row['amount']:
                 st.balloons()
                 st.success("🎉 Chúc mừng! Bạn đã đạt được mục tiêu!")
+            elif row['expected_date'] is None:
+                st.warning("📉 Với thu chi 12 tháng gần đây, mục tiêu này khó đạt được")
+            else:
+                st.write(f"🔮 Khả năng đạt đúng hạn: {row['probability']:.0%} · "
+                         f"dự kiến đạt ngày {row['expected_date']:%d/%m/%Y} "
+                         f"(80% khả năng trong khoảng {row['optimistic_date']:%d/%m/%Y} - {row['pessimistic_date']:%d/%m/%Y})")
 
 elif selected_option == "settings":
     # --- Cài đặt & Dữ liệu ---
@@ -469,6 +662,119 @@ elif selected_option == "settings":
     
     st.divider()
     
+    # Nhập giao dịch từ file CSV
+    st.subheader('📤 Nhập giao dịch từ CSV')
+    uploaded_file = st.file_uploader('Chọn file CSV (ngay, loai, danh_muc, so_tien, mo_ta)', type='csv')
+    unknown_policies = {
+        'Thêm danh mục mới': 'add',
+        'Gán vào "Khác"': 'other',
+        'Bỏ qua dòng': 'reject'
+    }
+    unknown_policy = st.radio('Danh mục chưa có', list(unknown_policies.keys()), horizontal=True)
+    
+    if uploaded_file is not None and st.button('📥 Nhập dữ liệu'):
+        progress_bar = st.progress(0.0)
+        
+        def report_progress(rows, inserted):
+            fraction = min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0)
+            progress_bar.progress(fraction, text=f'Đã đọc {rows:,} dòng, đã nhập {inserted:,} giao dịch')
+        
+        try:
+            result = import_transactions_csv(
+                st.session_state.db,
+                uploaded_file,
+                unknown_category=unknown_policies[unknown_policy],
+                progress=report_progress
+            )
+            st.session_state.db.load_categories()
+            st.success(f"Đã nhập {result['inserted']:,} / {result['rows']:,} giao dịch")
+            if result['duplicates']:
+                st.info(f"Bỏ qua {result['duplicates']:,} giao dịch đã có trong sổ")
+            if result['skipped']:
+                st.warning(f"Bỏ qua {result['skipped']:,} dòng không hợp lệ")
+                st.dataframe(pd.DataFrame(result['errors'], columns=['Dòng', 'Lỗi']), hide_index=True)
+        except Exception as e:
+            st.error(f'Lỗi: {str(e)}')
+    
+    # Quét trùng trên toàn bộ sổ bằng index fingerprint
+    st.subheader('🧮 Giao dịch trùng lặp')
+    duplicates = st.session_state.db.duplicate_summary()
+    if duplicates['groups']:
+        st.warning(f"{duplicates['groups']:,} nhóm giao dịch giống hệt nhau, "
+                   f"{duplicates['extra_rows']:,} dòng thừa ({format_currency(duplicates['extra_amount'])})")
+        with st.expander('Xem các nhóm trùng nhiều nhất'):
+            st.dataframe(st.session_state.db.find_duplicates(), hide_index=True)
+    else:
+        st.caption('Không có giao dịch trùng lặp')
+    
+    st.divider()
+    
+    # Chẩn đoán hiệu năng
+    st.subheader('🩺 Chẩn đoán hiệu năng')
+    col1, col2 = st.columns(2)
+    with col1:
+        query_log.enabled = st.toggle('Ghi log truy vấn chậm (kèm EXPLAIN QUERY PLAN)', value=query_log.enabled)
+    with col2:
+        query_log.slow_ms = st.number_input('Ngưỡng truy vấn chậm (ms)', min_value=1, value=int(query_log.slow_ms))
+    
+    metrics_snapshot = metrics.snapshot()
+    if metrics_snapshot:
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    'Tên': name,
+                    'Số lần gọi': stat['count'],
+                    'Lỗi': stat['errors'],
+                    'TB (ms)': round(stat['mean_ms'], 2),
+                    'p50 (ms)': round(stat['p50_ms'], 2),
+                    'p95 (ms)': round(stat['p95_ms'], 2),
+                    'Max (ms)': round(stat['max_ms'], 2),
+                    'Số dòng trả về': stat['rows'],
+                    'Bytes trả về': stat['bytes']
+                }
+                for name, stat in metrics_snapshot.items()
+            ]).sort_values('TB (ms)', ascending=False),
+            hide_index=True,
+            use_container_width=True
+        )
+    for cache_name, cache in [('Cache dữ liệu', data_cache), ('Cache biểu đồ', figure_cache)]:
+        cache_stats = cache.stats()
+        st.caption(f"{cache_name}: {cache_stats['entries']} mục, {cache_stats['bytes'] / 1024:,.0f} KB, "
+                   f"{cache_stats['hits']:,} hit / {cache_stats['misses']:,} miss")
+    first_render_ms = startup_state()['first_render_ms']
+    if first_render_ms is not None:
+        st.caption(f"Hiển thị lần đầu sau khi khởi động: {first_render_ms:,.0f} ms "
+                   f"(mục tiêu {FIRST_RENDER_TARGET_MS:,} ms)")
+    shard_stats = shard_router.stats()
+    st.caption(f"Shard đang mở: {shard_stats['open']}/{shard_stats['max_open']} "
+               f"(đã mở {shard_stats['opened']}, đã đóng {shard_stats['evicted']})")
+    
+    slow_queries = query_log.snapshot()
+    if slow_queries:
+        st.write('**Truy vấn chậm gần đây**')
+        for entry in reversed(slow_queries[-20:]):
+            with st.expander(f"{entry['name']} — {entry['ms']:.1f} ms (~{entry['vm_steps']:,} lệnh VM)"):
+                for statement in entry['statements']:
+                    st.code(statement['sql'].strip(), language='sql')
+                    if statement['plan']:
+                        st.text('\n'.join(statement['plan']))
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label='📥 Tải dump chẩn đoán (JSON)',
+            data=diagnostics_dump(),
+            file_name='diagnostics.json',
+            mime='application/json'
+        )
+    with col2:
+        if st.button('🔄 Đặt lại số liệu'):
+            metrics.reset()
+            query_log.entries.clear()
+            st.rerun()
+    
+    st.divider()
+    
     # Xóa dữ liệu
     st.subheader('⚠️ Xóa dữ liệu')
     
@@ -490,4 +796,8 @@ elif selected_option == "settings":
         with col2:
             if st.button('❌ Hủy bỏ'):
                 st.session_state.show_delete_confirmation = False
-                st.rerun()
\ No newline at end of file
+                st.rerun()
+
+stop_page_timer()
+stop_rerun_timer()
+record_first_render()
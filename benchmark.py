@@ -0,0 +1,333 @@
+# Bộ benchmark với dữ liệu tổng hợp cho Database, biểu đồ trong utils.py và các trang của app.py.
+#
+#   python benchmark.py --rows 10000 100000 1000000 --repeat 20 --json bench.json
+#
+# Mỗi cỡ dữ liệu được sinh tất định (cùng seed -> cùng sổ cái) vào một file SQLite tạm.
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from cache import data_cache
+from database import Database
+
+DEFAULT_SIZES = [10000]
+INCOME_WEIGHT = 0.15
+GENERATE_CHUNK_SIZE = 50000
+WORDS = ['Grab', 'cà phê', 'ăn trưa', 'siêu thị', 'tiền điện', 'tiền nước', 'xăng',
+         'sách', 'thuốc', 'học phí', 'lương', 'thưởng', 'quà', 'Shopee', 'xem phim']
+
+APP_PAGES = [
+    ("🏠 Tổng quan", None),
+    ("💸 Quản lý giao dịch", "➕ Thêm giao dịch mới"),
+    ("💸 Quản lý giao dịch", "📋 Xem lịch sử giao dịch"),
+    ("💸 Quản lý giao dịch", "📊 Phân tích chi tiêu"),
+    ("📋 Quản lý danh mục", None),
+    ("💰 Quản lý ngân sách", None),
+    ("⏰ Nhắc nhở thanh toán", None),
+    ("🎯 Mục tiêu tiết kiệm", None),
+    ("⚙️ Cài đặt & Dữ liệu", None),
+]
+
+# Chạy trong một tiến trình mới: trang đầu tiên sau đăng nhập, in metric app.first_render
+COLD_START_SCRIPT = '''
+import sys
+from streamlit.testing.v1 import AppTest
+from instrumentation import metrics
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+at.session_state['authenticated'] = True
+at.session_state['user_info'] = {'name': 'bench', 'email': 'bench@example.com'}
+at.run()
+print(metrics.snapshot()['app.first_render']['max_ms'])
+'''
+
+
+def generate_ledger(db, rows, categories=None, days=3 * 365, reminders=50, goals=10, recurring=20,
+                    end_date=date(2025, 12, 31), seed=42):
+    """Sinh sổ cái tổng hợp tất định vào ``db``.
+
+    categories: số danh mục chi (mặc định dùng danh mục có sẵn). Số tiền là bội
+    của 1.000đ, ngày phân bố đều trong ``days`` ngày kết thúc ở ``end_date``.
+    """
+    rng = random.Random(seed)
+    db.load_categories()
+    expense = list(db.expense_categories)
+    if categories is not None:
+        extra = [f'Danh mục {i}' for i in range(max(0, categories - len(expense)))]
+        db.add_categories([('expense', name) for name in extra])
+        expense = (expense + extra)[:categories]
+    income = list(db.income_categories)
+    start = end_date - timedelta(days=days - 1)
+
+    remaining = rows
+    while remaining > 0:
+        batch = []
+        for _ in range(min(GENERATE_CHUNK_SIZE, remaining)):
+            day = (start + timedelta(days=rng.randrange(days))).isoformat()
+            if rng.random() < INCOME_WEIGHT:
+                batch.append((day, 'Thu', rng.choice(income), rng.randint(500, 30000) * 1000.0,
+                              f'{rng.choice(WORDS)} {rng.randrange(1000)}'))
+            else:
+                batch.append((day, 'Chi', rng.choice(expense), rng.randint(5, 2000) * 1000.0,
+                              f'{rng.choice(WORDS)} {rng.choice(WORDS)}'))
+        db.add_transactions(batch)
+        remaining -= len(batch)
+
+    for category in expense:
+        db.set_budget(category, rng.randint(1, 50) * 1000000)
+    for i in range(reminders):
+        due = start + timedelta(days=rng.randrange(days + 60))
+        db.add_reminder(f'Nhắc nhở {i}', due.isoformat(), rng.randint(10, 5000) * 1000,
+                        rng.choice(expense))
+    for i in range(goals):
+        target = end_date + timedelta(days=rng.randrange(30, 1500))
+        db.add_saving_goal(f'Mục tiêu {i}', rng.randint(10, 1000) * 1000000, target.isoformat())
+    # Quy tắc định kỳ bắt đầu trong khoảng của sổ cái, chưa được ghi thành giao dịch
+    for i in range(recurring):
+        first = start + timedelta(days=rng.randrange(days))
+        db.add_recurring_rule(f'Định kỳ {i}', 'Chi', rng.choice(expense), rng.randint(50, 5000) * 1000,
+                              rng.choice(['weekly', 'monthly', 'monthly', 'yearly']), first.isoformat())
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, repeat=10, warmup=1, setup=None):
+    # Trả về độ trễ (ms) p50/p95/p99 và bộ nhớ đỉnh (MB) của một lần chạy riêng có tracemalloc
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+        'mean_ms': statistics.fmean(samples),
+        'peak_mb': peak / 1024 / 1024,
+    }
+
+
+def database_benchmarks(db):
+    # (tên, hàm) cho từng phương thức của Database; ghi dùng dữ liệu riêng để không lệch kết quả đọc
+    first_date, last_date = db.get_date_range()
+    counter = iter(range(10 ** 9))
+    return [
+        ('load_transactions', db.load_transactions),
+        ('get_initial_balance', db.get_initial_balance),
+        ('get_totals', db.get_totals),
+        ('get_balance', db.get_balance),
+        ('get_transaction_count', db.get_transaction_count),
+        ('get_category_summary', db.get_category_summary),
+        ('get_daily_expenses', db.get_daily_expenses),
+        ('get_period_summary[M]', lambda: db.get_period_summary('M')),
+        ('get_period_summary[Q]', lambda: db.get_period_summary('Q')),
+        ('get_period_summary[Y]', lambda: db.get_period_summary('Y')),
+        ('get_budgets', db.get_budgets),
+        ('evaluate_budgets', lambda: db.evaluate_budgets(last_date)),
+        ('check_budget_alert', lambda: db.check_budget_alert('Ăn uống', last_date, 1000)),
+        ('get_reminders', db.get_reminders),
+        ('count_reminders', db.count_reminders),
+        ('query_reminders[upcoming]', lambda: db.query_reminders('upcoming')),
+        ('get_saving_goals', db.get_saving_goals),
+        ('forecast_saving_goals', lambda: db.forecast_saving_goals(last_date)),
+        ('list_categories', db.list_categories),
+        ('get_date_range', db.get_date_range),
+        ('count_transactions[Chi]', lambda: db.count_transactions(loai='Chi')),
+        ('query_transactions[page]', lambda: db.query_transactions(limit=50)),
+        ('query_transactions[filtered]', lambda: db.query_transactions(
+            loai='Chi', danh_muc='Ăn uống', start=first_date, end=last_date, limit=50)),
+        ('search_transactions[grab]', lambda: db.search_transactions('grab', limit=50)),
+        ('search_transactions[filtered]', lambda: db.search_transactions(
+            'an trua', loai='Chi', start=first_date, end=last_date, limit=50)),
+        ('count_search_results', lambda: db.count_search_results('ca phe')),
+        ('iter_transactions[all]', lambda: sum(len(chunk) for chunk in db.iter_transactions())),
+        ('verify_aggregates', db.verify_aggregates),
+        ('duplicate_summary', db.duplicate_summary),
+        ('find_duplicates', db.find_duplicates),
+        ('project_recurring[1y]', lambda: db.project_recurring(
+            last_date, (date.fromisoformat(last_date) + timedelta(days=365)).isoformat())),
+        # Lần khởi động ghi các lần phát sinh đến hạn; các lần đo là đường kiểm tra nhanh khi đã cập nhật
+        ('materialize_recurring', lambda: db.materialize_recurring(last_date)),
+        ('add_transaction', lambda: db.add_transaction(
+            last_date, 'Chi', 'Khác', 1000, f'benchmark {next(counter)}')),
+        ('add_transactions[1000]', lambda: db.add_transactions(
+            [(last_date, 'Chi', 'Khác', 1000, 'benchmark')] * 1000)),
+        ('set_budget', lambda: db.set_budget('Khác', 1000000)),
+    ]
+
+
+def chart_benchmarks(db):
+    import utils
+
+    category_summary = db.get_category_summary()
+    daily_expenses = db.get_daily_expenses()
+    return [
+        ('create_expense_by_category_chart',
+         lambda: utils.create_expense_by_category_chart.uncached(category_summary)),
+        ('create_expense_trend_chart',
+         lambda: utils.create_expense_trend_chart.uncached(daily_expenses)),
+        ('create_expense_by_category_chart[cached]',
+         lambda: utils.create_expense_by_category_chart(category_summary)),
+        ('create_expense_trend_chart[cached]',
+         lambda: utils.create_expense_trend_chart(daily_expenses)),
+    ]
+
+
+def page_benchmarks(db_path, repeat):
+    # Chạy headless từng trang của app.py bằng AppTest trên database tổng hợp
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print('streamlit chưa được cài, bỏ qua benchmark trang', file=sys.stderr)
+        return {}
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    results = {}
+    cwd = os.getcwd()
+    # app.py mở 'finance.db' trong thư mục hiện tại
+    os.chdir(os.path.dirname(db_path))
+    try:
+        for main, sub in APP_PAGES:
+            def render():
+                at = AppTest.from_file(app_path, default_timeout=600)
+                at.session_state['authenticated'] = True
+                at.session_state['user_info'] = {'name': 'bench', 'email': 'bench@example.com'}
+                at.run()
+                at.selectbox(key='main_menu').select(main).run()
+                if sub:
+                    at.selectbox(key='sub_menu').select(sub).run()
+                if at.exception:
+                    raise RuntimeError(f'{main} {sub}: {at.exception}')
+            results[f'page {sub or main}'] = measure(render, repeat=repeat, warmup=1)
+    finally:
+        os.chdir(cwd)
+    results['cold start (first render)'] = cold_start_benchmark(app_path, db_path, repeat)
+    return results
+
+
+def cold_start_benchmark(app_path, db_path, repeat):
+    # Mỗi mẫu là một tiến trình Python mới: import, mở database có sẵn và hiển thị trang đầu
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(app_path))
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT, app_path],
+                                cwd=os.path.dirname(db_path), env=env,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(float(output.split()[-1]))
+    return {
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99),
+        'mean_ms': statistics.fmean(samples),
+        'peak_mb': 0.0,  # Không đo bộ nhớ ở tiến trình con
+    }
+
+
+def shard_churn_check(users=40, max_open=4):
+    # Lần lượt mở nhiều shard write-behind hơn max_open: số thread ghi còn sống phải
+    # giữ ở mức max_open (shard bị loại khỏi LRU dừng thread ghi của nó) chứ không tăng
+    # theo số người dùng, và về 0 sau khi đóng router
+    from sharding import ShardRouter
+
+    def writer_threads():
+        return sum(thread.name == 'finance-write-behind' for thread in threading.enumerate())
+
+    with tempfile.TemporaryDirectory(prefix='finance-shards-') as base_dir:
+        router = ShardRouter(base_dir, max_open=max_open, write_behind=True)
+        baseline = writer_threads()
+        peak = 0
+        for i in range(users):
+            db = router.get(f'user{i}')
+            db.add_transaction(date(2025, 1, 1), 'Chi', 'Ăn uống', 1000, 'tải thử')
+            peak = max(peak, writer_threads() - baseline)
+        router.close()
+        result = {'users': users, 'max_open': max_open, 'peak_writer_threads': peak,
+                  'writer_threads_after_close': writer_threads() - baseline}
+    result['ok'] = peak <= max_open and result['writer_threads_after_close'] == 0
+    return result
+
+
+def run(sizes, repeat=10, cold=False, pages=True, seed=42):
+    report = {}
+    for rows in sizes:
+        workdir = tempfile.mkdtemp(prefix='finance-bench-')
+        db_path = os.path.join(workdir, 'finance.db')
+        db = Database(db_path)
+        started = time.perf_counter()
+        generate_ledger(db, rows, seed=seed)
+        print(f'\n== {rows:,} dòng (sinh dữ liệu {time.perf_counter() - started:.1f}s) ==')
+
+        # cold: xóa cache dữ liệu trước mỗi lần đo để đo chi phí truy vấn thật
+        setup = data_cache.clear if cold else None
+        results = {}
+        for name, fn in database_benchmarks(db) + chart_benchmarks(db):
+            results[name] = measure(fn, repeat=repeat, setup=setup)
+            print_result(name, results[name])
+        if pages:
+            for name, result in page_benchmarks(db_path, max(1, repeat // 5)).items():
+                results[name] = result
+                print_result(name, result)
+        report[rows] = results
+        db.close()
+    return report
+
+
+def print_result(name, result):
+    print(f"{name:<36} p50 {result['p50_ms']:>10.2f}ms  p95 {result['p95_ms']:>10.2f}ms  "
+          f"p99 {result['p99_ms']:>10.2f}ms  peak {result['peak_mb']:>8.2f}MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark Database, biểu đồ và các trang với dữ liệu tổng hợp')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Số giao dịch cần sinh, ví dụ 10000 100000 1000000 10000000')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cold', action='store_true', help='Xóa cache dữ liệu trước mỗi lần đo')
+    parser.add_argument('--no-pages', action='store_true', help='Bỏ qua benchmark trang bằng AppTest')
+    parser.add_argument('--json', help='Ghi kết quả ra file JSON')
+    parser.add_argument('--shard-churn', type=int, metavar='USERS',
+                        help='Chỉ kiểm tra số thread ghi khi mở lần lượt USERS shard write-behind')
+    args = parser.parse_args(argv)
+
+    if args.shard_churn:
+        result = shard_churn_check(args.shard_churn)
+        print(f"{result['users']} người dùng, max_open {result['max_open']}: tối đa "
+              f"{result['peak_writer_threads']} thread ghi, còn {result['writer_threads_after_close']} sau khi đóng")
+        sys.exit(0 if result['ok'] else 1)
+
+    report = run(args.rows, repeat=args.repeat, cold=args.cold,
+                 pages=not args.no_pages, seed=args.seed)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+# Công cụ dòng lệnh cho các tác vụ định kỳ, không cần Streamlit:
+#
+#   python cli.py import finance.db sao_ke_thang_9.csv
+#   python cli.py report finance.db --period Q -o bao_cao_tai_chinh.csv
+#   python cli.py export finance.db --format csv.gz --start 2025-01-01
+#   python cli.py vacuum shards/ --jobs 4
+#   python cli.py integrity shards/ --json
+#
+# Đường dẫn là thư mục thì mọi file *.db bên trong (kể cả thư mục con của
+# ShardRouter) đều được xử lý; nhiều file chạy song song trong ProcessPoolExecutor.
+# Mã thoát khác 0 khi có file lỗi hoặc kiểm tra toàn vẹn thất bại.
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import data_io
+from database import Database
+from utils import format_currency
+
+REPORT_NAME = 'bao_cao_tai_chinh.csv'
+EXPORT_NAME = 'giao_dich'
+
+
+def find_databases(paths):
+    # Mở rộng thư mục thành các file *.db, bỏ trùng và giữ thứ tự
+    found = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            found.extend(sorted(path.rglob('*.db')))
+        elif path.exists():
+            found.append(path)
+        else:
+            raise FileNotFoundError(f'Không tìm thấy database: {path}')
+    return list(dict.fromkeys(str(p) for p in found))
+
+
+def output_path(db_path, output, default_name, multiple):
+    # Một database: output là tên file; nhiều database: output là thư mục,
+    # mỗi file kết quả mang tiền tố tên database
+    if not multiple:
+        return output or default_name
+    os.makedirs(output or '.', exist_ok=True)
+    return os.path.join(output or '.', f'{Path(db_path).stem}_{default_name}')
+
+
+def _filters(options):
+    return {key: options[key] for key in ('loai', 'danh_muc', 'start', 'end') if options.get(key)}
+
+
+def run_import(db, options):
+    def progress(rows, inserted):
+        if options['verbose']:
+            print(f'  {rows} dòng đã đọc, {inserted} dòng đã nhập', file=sys.stderr)
+
+    totals = {'rows': 0, 'inserted': 0, 'skipped': 0, 'duplicates': 0, 'errors': 0}
+    for source in options['csv']:
+        result = data_io.import_transactions_csv(
+            db, source, chunk_size=options['chunk_size'], unknown_category=options['unknown_category'],
+            progress=progress, on_duplicate=options['on_duplicate'])
+        for key in ('rows', 'inserted', 'skipped', 'duplicates'):
+            totals[key] += result[key]
+        totals['errors'] += len(result['errors'])
+    message = (f"nhập {totals['inserted']}/{totals['rows']} dòng, bỏ qua {totals['skipped']} lỗi, "
+               f"{totals['duplicates']} trùng")
+    return True, message, totals
+
+
+def run_export(db, options):
+    path = output_path(db.db_name, options['output'],
+                       f"{EXPORT_NAME}.{data_io.EXPORT_FORMATS[options['format']][0]}",
+                       options['multiple'])
+    with open(path, 'wb') as f:
+        data_io.export_transactions(db, f, options['format'], chunk_size=options['chunk_size'],
+                                    **_filters(options))
+    return True, f'ghi {path}', {'output': path}
+
+
+def run_report(db, options):
+    summary = db.get_period_summary(options['period'])
+    summary = summary.reindex(columns=['Thu', 'Chi'], fill_value=0).round().astype('int64')
+    summary['Chênh lệch'] = summary['Thu'] - summary['Chi']
+    path = output_path(db.db_name, options['output'], REPORT_NAME, options['multiple'])
+    summary.to_csv(path, index_label='Kỳ', encoding='utf-8-sig')
+    income, expense = summary['Thu'].sum(), summary['Chi'].sum()
+    message = (f'{len(summary)} kỳ, thu {format_currency(income)}, '
+               f'chi {format_currency(expense)} -> {path}')
+    return True, message, {'output': path, 'periods': len(summary),
+                           'income': int(income), 'expense': int(expense)}
+
+
+def run_rebuild_aggregates(db, options):
+    db.rebuild_aggregates()
+    mismatches = db.verify_aggregates()
+    return not mismatches, 'bảng tổng hợp khớp' if not mismatches else f'lệch: {mismatches}', mismatches
+
+
+def run_vacuum(db, options):
+    before, after = db.vacuum()
+    db.analyze()
+    return True, f'{before / 1e6:.1f}MB -> {after / 1e6:.1f}MB', {'before': before, 'after': after}
+
+
+def run_analyze(db, options):
+    db.analyze()
+    return True, 'đã cập nhật thống kê', {}
+
+
+def run_duplicates(db, options):
+    summary = db.duplicate_summary()
+    if options['verbose'] and summary['groups']:
+        summary['items'] = db.find_duplicates()[['ids', 'ngay', 'danh_muc', 'so_tien', 'mo_ta']].to_dict('records')
+    message = (f"{summary['groups']} nhóm trùng, {summary['extra_rows']} dòng thừa "
+               f"({format_currency(summary['extra_amount'])})")
+    return True, message, summary
+
+
+def run_integrity(db, options):
+    problems = db.integrity_check()
+    return not problems, 'ok' if not problems else f'{len(problems)} vấn đề', {'problems': problems}
+
+
+COMMANDS = {
+    'import': run_import,
+    'export': run_export,
+    'report': run_report,
+    'rebuild-aggregates': run_rebuild_aggregates,
+    'vacuum': run_vacuum,
+    'analyze': run_analyze,
+    'integrity': run_integrity,
+    'duplicates': run_duplicates,
+}
+
+
+def run_task(command, db_path, options):
+    # Chạy trong tiến trình con: mỗi database có kết nối và bộ nhớ đệm riêng
+    started = time.perf_counter()
+    db = Database(db_path)
+    try:
+        ok, message, details = COMMANDS[command](db, options)
+    except Exception as e:
+        ok, message, details = False, f'{type(e).__name__}: {e}', {}
+    finally:
+        db.close()
+    return {'db': db_path, 'command': command, 'ok': ok, 'message': message,
+            'details': details, 'ms': (time.perf_counter() - started) * 1000}
+
+
+def run_all(command, db_paths, options, jobs=None):
+    # Một database chạy ngay trong tiến trình hiện tại để khỏi tốn chi phí tạo pool
+    jobs = min(jobs or os.cpu_count() or 1, len(db_paths))
+    if jobs <= 1:
+        for path in db_paths:
+            yield run_task(command, path, options)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(run_task, [command] * len(db_paths), db_paths,
+                                [options] * len(db_paths))
+
+
+def build_parser():
+    # Tùy chọn chung đặt sau tên lệnh: python cli.py vacuum shards/ --jobs 4
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--jobs', type=int, help='Số tiến trình song song khi có nhiều database (mặc định: số CPU)')
+    common.add_argument('--json', action='store_true', help='In mỗi kết quả một dòng JSON')
+    common.add_argument('-v', '--verbose', action='store_true')
+
+    parser = argparse.ArgumentParser(description='Nhập, xuất, báo cáo và bảo trì database tài chính không cần giao diện')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='Nhập giao dịch từ file CSV', parents=[common])
+    import_parser.add_argument('database', help='File database (được tạo nếu chưa có)')
+    import_parser.add_argument('csv', nargs='+', help='File CSV: ngay,loai,danh_muc,so_tien,mo_ta')
+    import_parser.add_argument('--unknown-category', choices=['add', 'other', 'reject'], default='add',
+                               help='Xử lý danh mục chưa có')
+    import_parser.add_argument('--on-duplicate', choices=['skip', 'allow', 'reject'], default='skip',
+                               help='Xử lý dòng đã có trong sổ (mặc định bỏ qua: nhập lại an toàn)')
+    import_parser.add_argument('--chunk-size', type=int, default=data_io.IMPORT_CHUNK_SIZE)
+
+    export_parser = subparsers.add_parser('export', help='Xuất giao dịch theo từng khối', parents=[common])
+    export_parser.add_argument('databases', nargs='+')
+    export_parser.add_argument('--format', choices=list(data_io.EXPORT_FORMATS), default='csv')
+    export_parser.add_argument('-o', '--output', help='File kết quả (nhiều database: thư mục)')
+    export_parser.add_argument('--loai', choices=['Thu', 'Chi'])
+    export_parser.add_argument('--danh-muc')
+    export_parser.add_argument('--start', help='Từ ngày (YYYY-MM-DD)')
+    export_parser.add_argument('--end', help='Đến ngày (YYYY-MM-DD)')
+    export_parser.add_argument('--chunk-size', type=int, default=data_io.EXPORT_CHUNK_SIZE)
+
+    report_parser = subparsers.add_parser('report', help='Báo cáo thu chi theo kỳ ra CSV', parents=[common])
+    report_parser.add_argument('databases', nargs='+')
+    report_parser.add_argument('--period', choices=['M', 'Q', 'Y'], default='M',
+                               help='Tháng, quý hoặc năm')
+    report_parser.add_argument('-o', '--output', help=f'File kết quả, mặc định {REPORT_NAME} (nhiều database: thư mục)')
+
+    for name, help_text in [('rebuild-aggregates', 'Tính lại và kiểm tra các bảng tổng hợp'),
+                            ('vacuum', 'Gộp chỉ mục tìm kiếm, VACUUM và ANALYZE'),
+                            ('analyze', 'Cập nhật thống kê cho query planner'),
+                            ('integrity', 'Kiểm tra toàn vẹn SQLite, khóa ngoại, FTS và bảng tổng hợp'),
+                            ('duplicates', 'Báo cáo các giao dịch trùng lặp theo fingerprint')]:
+        subparsers.add_parser(name, help=help_text, parents=[common]).add_argument('databases', nargs='+')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'import':
+        db_paths = [args.database]
+    else:
+        try:
+            db_paths = find_databases(args.databases)
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 2
+    options = {key: value for key, value in vars(args).items() if key not in ('databases', 'database')}
+    options['multiple'] = len(db_paths) > 1
+
+    failed = 0
+    for result in run_all(args.command, db_paths, options, args.jobs):
+        failed += not result['ok']
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, default=str))
+        else:
+            status = 'OK ' if result['ok'] else 'LỖI'
+            print(f"{status} {result['db']}: {result['message']} ({result['ms']:.0f}ms)")
+            if args.verbose:
+                for problem in result['details'].get('problems', []):
+                    print(f'    {problem}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
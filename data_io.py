@@ -0,0 +1,242 @@
+import csv
+import io
+import gzip
+import functools
+import importlib.util
+import unicodedata
+from datetime import date, datetime
+
+IMPORT_COLUMNS = ['ngay', 'loai', 'danh_muc', 'so_tien', 'mo_ta']
+# Cột tùy chọn: mã giao dịch của ngân hàng, chỉ dùng để nhận ra dòng đã nhập (fingerprint)
+REFERENCE_COLUMN = 'ma_tham_chieu'
+IMPORT_CHUNK_SIZE = 10000
+MAX_REPORTED_ERRORS = 100
+OTHER_CATEGORY = 'Khác'
+
+# Các cách viết loại giao dịch được chấp nhận trong file CSV
+TYPE_ALIASES = {
+    'thu': 'Thu', 'income': 'Thu', 'thu nhap': 'Thu', 'thu nhập': 'Thu',
+    'chi': 'Chi', 'expense': 'Chi', 'chi tieu': 'Chi', 'chi tiêu': 'Chi',
+}
+CATEGORY_TYPES = {'Thu': 'income', 'Chi': 'expense'}
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d']
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_name(name):
+    # So khớp danh mục không phân biệt hoa thường, khoảng trắng thừa và dạng Unicode
+    return ' '.join(unicodedata.normalize('NFC', name).casefold().split())
+
+
+def parse_date(value):
+    value = value.strip()
+    try:
+        # Đường nhanh cho định dạng chuẩn YYYY-MM-DD
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS[1:]:
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ImportRowError(f'Ngày không hợp lệ: {value!r}')
+
+
+def parse_amount(value):
+    cleaned = value.replace('đ', '').replace(',', '').replace(' ', '').strip()
+    try:
+        amount = float(cleaned)
+    except ValueError:
+        raise ImportRowError(f'Số tiền không hợp lệ: {value!r}')
+    if amount < 0:
+        raise ImportRowError(f'Số tiền âm: {value!r}')
+    return amount
+
+
+class CategoryResolver:
+    """Chuẩn hóa tên danh mục theo bảng categories.
+
+    unknown_category: 'add' (thêm danh mục mới), 'other' (gán vào 'Khác')
+    hoặc 'reject' (báo lỗi dòng).
+    """
+
+    def __init__(self, db, unknown_category='add'):
+        if unknown_category not in ('add', 'other', 'reject'):
+            raise ValueError(f'unknown_category không hợp lệ: {unknown_category}')
+        self.db = db
+        self.unknown_category = unknown_category
+        self.known = {
+            (category_type, normalize_name(name)): name
+            for category_type, name in db.list_categories()
+        }
+        self.pending = []
+
+    def resolve(self, trans_type, name):
+        category_type = CATEGORY_TYPES[trans_type]
+        name = ' '.join(name.split())
+        key = (category_type, normalize_name(name))
+        if key in self.known:
+            return self.known[key]
+        if not name or self.unknown_category == 'other':
+            return self.known.get((category_type, normalize_name(OTHER_CATEGORY)), OTHER_CATEGORY)
+        if self.unknown_category == 'reject':
+            raise ImportRowError(f'Danh mục không tồn tại: {name!r}')
+        self.known[key] = name
+        self.pending.append((category_type, name))
+        return name
+
+    def flush(self):
+        # Ghi các danh mục mới phát hiện trong khối hiện tại
+        if self.pending:
+            self.db.add_categories(self.pending)
+            self.pending = []
+
+
+def _open_text(source):
+    # Nhận đường dẫn, file nhị phân (ví dụ file tải lên của Streamlit) hoặc file văn bản
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        return open(source, 'r', encoding='utf-8-sig', newline=''), True
+    if isinstance(source, io.TextIOBase):
+        return source, False
+    return io.TextIOWrapper(source, encoding='utf-8-sig', newline=''), False
+
+
+def parse_row(record, resolver):
+    trans_type = TYPE_ALIASES.get(normalize_name(record.get('loai') or ''))
+    if trans_type is None:
+        raise ImportRowError(f"Loại giao dịch không hợp lệ: {record.get('loai')!r}")
+    return (
+        parse_date(record.get('ngay') or ''),
+        trans_type,
+        resolver.resolve(trans_type, record.get('danh_muc') or ''),
+        parse_amount(record.get('so_tien') or ''),
+        (record.get('mo_ta') or '').strip(),
+        (record.get(REFERENCE_COLUMN) or '').strip() or None,
+    )
+
+
+def import_transactions_csv(db, source, chunk_size=IMPORT_CHUNK_SIZE,
+                            unknown_category='add', progress=None, on_duplicate='skip'):
+    """Nhập giao dịch từ CSV (ngay,loai,danh_muc,so_tien,mo_ta[,ma_tham_chieu]) theo từng khối.
+
+    File được đọc tuần tự, mỗi khối ``chunk_size`` dòng hợp lệ được ghi bằng
+    ``executemany`` trong một giao dịch. ``progress(rows_read, inserted)`` được
+    gọi sau mỗi khối. on_duplicate='skip' bỏ các dòng đã có trong sổ từ trước
+    nên nhập lại một file (hay một bản sao kê chồng lấn) không tạo dòng trùng.
+    Trả về dict gồm số dòng đã đọc, đã nhập, bị trùng và các lỗi.
+    """
+    resolver = CategoryResolver(db, unknown_category)
+    result = {'rows': 0, 'inserted': 0, 'skipped': 0, 'duplicates': 0, 'errors': []}
+    deduplicator = db.deduplicator() if on_duplicate == 'skip' else None
+    stream, owns_stream = _open_text(source)
+
+    def flush(batch):
+        resolver.flush()
+        if batch:
+            inserted = db.add_transactions(batch, on_duplicate, deduplicator)
+            result['inserted'] += inserted
+            result['duplicates'] += len(batch) - inserted
+        if progress is not None:
+            progress(result['rows'], result['inserted'])
+
+    try:
+        reader = csv.DictReader(stream)
+        missing = [c for c in IMPORT_COLUMNS[:4] if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Thiếu cột trong file CSV: {', '.join(missing)}")
+
+        batch = []
+        for record in reader:
+            result['rows'] += 1
+            try:
+                batch.append(parse_row(record, resolver))
+            except ImportRowError as e:
+                result['skipped'] += 1
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append((reader.line_num, str(e)))
+                continue
+            if len(batch) >= chunk_size:
+                flush(batch)
+                batch = []
+        flush(batch)
+    finally:
+        if owns_stream:
+            stream.close()
+        else:
+            # Không đóng file của người gọi khi bỏ lớp TextIOWrapper
+            if isinstance(stream, io.TextIOWrapper) and stream is not source:
+                stream.detach()
+    return result
+
+
+# Định dạng xuất: phần mở rộng file và MIME type
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+EXPORT_CHUNK_SIZE = 50000
+
+
+def available_export_formats():
+    # Chỉ kiểm tra pyarrow có được cài không, chưa import
+    has_pyarrow = importlib.util.find_spec('pyarrow') is not None
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or has_pyarrow]
+
+
+def _write_csv(chunks, binary_file):
+    text = io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+    try:
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(text, index=False, header=header)
+            header = False
+        if header:
+            text.write(','.join(['id'] + IMPORT_COLUMNS) + '\n')
+        text.flush()
+    finally:
+        text.detach()
+
+
+def _write_parquet(chunks, binary_file):
+    # pyarrow (tùy chọn) được import khi xuất Parquet lần đầu, không làm chậm lúc app khởi động
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Cần cài đặt pyarrow để xuất Parquet') from None
+    schema = pa.schema([
+        ('id', pa.int64()), ('ngay', pa.string()), ('loai', pa.string()),
+        ('danh_muc', pa.string()), ('so_tien', pa.int64()), ('mo_ta', pa.string()),
+    ])
+    with pq.ParquetWriter(binary_file, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def export_transactions(db, binary_file, fmt='csv', chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """Ghi giao dịch (có thể lọc theo loai, danh_muc, start, end) ra file nhị phân.
+
+    Dữ liệu được đọc từ SQLite theo từng khối và ghi ngay ra file, nên bộ nhớ
+    không phụ thuộc số dòng. fmt: 'csv', 'csv.gz' hoặc 'parquet'.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Định dạng xuất không hỗ trợ: {fmt}')
+    chunks = db.iter_transactions(chunk_size=chunk_size, **filters)
+    if fmt == 'parquet':
+        _write_parquet(chunks, binary_file)
+    elif fmt == 'csv.gz':
+        with gzip.GzipFile(fileobj=binary_file, mode='wb') as gz:
+            _write_csv(chunks, gz)
+    else:
+        _write_csv(chunks, binary_file)
+
+
+def export_transactions_to_file(db, path, fmt='csv', **filters):
+    with open(path, 'wb') as f:
+        export_transactions(db, f, fmt, **filters)
@@ -1,202 +1,1455 @@
+import calendar
+import os
+import re
 import sqlite3
+import unicodedata
+import queue
+import threading
+import functools
+import atexit
+import time
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import date, datetime
+from concurrent.futures import Future
 from contextlib import contextmanager
+from cache import data_cache
+from instrumentation import instrument_methods, metrics, query_log
+from dedupe import DUPLICATE_POLICIES, Deduplicator, DuplicateTransactionError, transaction_fingerprint
+from forecast import (FORECAST_PATHS, LOOKBACK_MONTHS, fit_category_models, forecast_goals, horizon_months,
+                      month_key, simulate_cash_flows)
+from migrations import migrate
+from scheduling import (BUDGET_PERIODS, FREQUENCIES, RECURRENCES, day_number, from_day_number,
+                        next_occurrence, occurrences, period_bounds, to_date, today_number)
 
+# Pragma áp dụng cho mỗi kết nối mới trong pool
+CONNECTION_PRAGMAS = {
+    'synchronous': 'NORMAL',     # An toàn với WAL, chỉ fsync khi checkpoint
+    'cache_size': -20000,        # ~20MB page cache cho mỗi kết nối
+    'mmap_size': 268435456,      # 256MB memory-mapped I/O
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,        # Chờ khóa ghi thay vì lỗi "database is locked"
+    'foreign_keys': 'ON',        # transactions.category_id tham chiếu categories
+}
+
+# Ghi trễ (write-behind): gom các lệnh ghi vào một giao dịch. Với cửa sổ 0ms, một lô
+# gồm các lệnh đã đến trong lúc lô trước đang commit; cửa sổ lớn hơn chỉ có lợi khi
+# commit đắt (synchronous=FULL) vì mỗi người gọi phải chờ thêm đúng khoảng đó
+WRITE_BEHIND_WINDOW_MS = 0
+WRITE_BEHIND_MAX_BATCH = 500
+WRITE_BEHIND_MAX_PENDING = 10000
+
+BUMP_VERSION_SQL = "UPDATE meta SET value = value + 1 WHERE key = 'data_version'"
+
+# Giao dịch lưu ngày dạng số nguyên (scheduling.day_number) và danh mục dạng khóa ngoại.
+# Biểu thức SQL đổi về dạng hiển thị: ngày 'YYYY-MM-DD' và loại 'Thu'/'Chi'.
+JULIAN_DAY_OFFSET = 1721424.5  # julianday(d) = day_number(d) + JULIAN_DAY_OFFSET
+_DATE_SQL = f"date({{r}}.ngay + {JULIAN_DAY_OFFSET})"
+_LOAI_SQL = "CASE {c}.type WHEN 'income' THEN 'Thu' WHEN 'expense' THEN 'Chi' ELSE {c}.type END"
+CATEGORY_TYPES = {'Thu': 'income', 'Chi': 'expense'}
+# Ngày 1970-01-01 dạng day number, để đổi cột ngay sang datetime64
+EPOCH_DAY = 719163
+
+# Các bảng tổng hợp được trigger cập nhật song song với bảng transactions.
+# Mỗi bảng gồm danh sách (cột khóa, biểu thức tính từ một dòng giao dịch {r}
+# và dòng danh mục {c} của nó).
+_DAY_EXPR = f"COALESCE({_DATE_SQL}, '')"
+AGGREGATE_TABLES = {
+    'totals': [
+        ('loai', _LOAI_SQL),
+    ],
+    'category_totals': [
+        ('loai', _LOAI_SQL),
+        ('danh_muc', '{c}.name'),
+    ],
+    'daily_totals': [
+        ('loai', _LOAI_SQL),
+        ('ngay', _DAY_EXPR),
+        ('danh_muc', '{c}.name'),
+    ],
+    'monthly_totals': [
+        ('loai', _LOAI_SQL),
+        ('thang', f"substr({_DAY_EXPR}, 1, 7)"),
+        ('danh_muc', '{c}.name'),
+    ],
+}
+
+# Nhãn kỳ tính từ cột thang ('YYYY-MM'), cùng định dạng với pandas Period
+PERIOD_EXPRESSIONS = {
+    'M': 'thang',
+    'Q': "substr(thang, 1, 4) || 'Q' || ((CAST(substr(thang, 6, 2) AS INTEGER) + 2) / 3)",
+    'Y': 'substr(thang, 1, 4)',
+}
+
+
+def _aggregate_apply_sql(table, keys, row, sign):
+    # Cộng (sign = '+') hoặc trừ (sign = '-') một dòng giao dịch vào bảng tổng hợp
+    columns = ', '.join(column for column, _ in keys)
+    exprs = ', '.join(expr.format(r=row, c='c') for _, expr in keys)
+    source = f'FROM categories c WHERE c.id = {row}.category_id'
+    if sign == '+':
+        return (f"INSERT INTO {table} ({columns}, so_tien, so_luong) "
+                f"SELECT {exprs}, {row}.so_tien, 1 {source} "
+                f"ON CONFLICT ({columns}) DO UPDATE SET "
+                f"so_tien = so_tien + excluded.so_tien, so_luong = so_luong + 1;")
+    return '\n'.join([
+        f"UPDATE {table} SET so_tien = so_tien - {row}.so_tien, so_luong = so_luong - 1 "
+        f"WHERE ({columns}) = (SELECT {exprs} {source});",
+        f"DELETE FROM {table} WHERE so_luong <= 0 AND ({columns}) = (SELECT {exprs} {source});",
+    ])
+
+
+def encode_day(value):
+    # Ngày giao dịch dạng day number; None hoặc chuỗi không phải ngày hợp lệ -> NULL
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    try:
+        return day_number(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def search_match_query(text):
+    """Chuỗi MATCH của FTS5 cho nội dung người dùng gõ, hoặc None nếu không có từ nào.
+
+    Văn bản được chuẩn hóa như khi đánh chỉ mục ('đ' -> 'd', NFC); mỗi từ là một
+    tiền tố trong ngoặc kép nên "an uong" khớp "ăn uống" và ký tự đặc biệt của
+    cú pháp FTS5 không có tác dụng.
+    """
+    text = unicodedata.normalize('NFC', text).replace('đ', 'd').replace('Đ', 'D')
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"*' for term in terms) or None
+
+
+def cached_query(method):
+    # Cache kết quả đọc theo data_version; mọi thao tác ghi đều tăng version
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (self._cache_namespace, method.__name__, args, tuple(sorted(kwargs.items())))
+        value = data_cache.get_or_compute(
+            key, self.data_version(), lambda: method(self, *args, **kwargs))
+        # Trả bản sao nông để trang gọi không làm hỏng giá trị dùng chung
+        if isinstance(value, pd.DataFrame):
+            return value.copy(deep=False)
+        if isinstance(value, (dict, list)):
+            return value.copy()
+        return value
+    return wrapper
+
+
+# Số kết quả tìm kiếm tối đa còn được xếp theo độ liên quan (xem search_transactions)
+SEARCH_RANK_MAX_MATCHES = 10000
+# Số fingerprint mỗi truy vấn IN khi kiểm tra trùng (dưới giới hạn tham số của SQLite)
+FINGERPRINT_LOOKUP_CHUNK = 500
+MAX_ROW_ID = 2 ** 63 - 1
+INSERT_TRANSACTION_SQL = '''
+    INSERT INTO transactions (ngay, category_id, so_tien, mo_ta, fingerprint) VALUES (?, ?, ?, ?, ?)
+'''
+# Danh mục (type, name) được thêm khi mở database lần đầu
+DEFAULT_CATEGORIES = [
+    *(('income', name) for name in ['Lương', 'Thưởng', 'Đầu tư', 'Kinh doanh', 'Quà tặng', 'Khác']),
+    *(('expense', name) for name in ['Ăn uống', 'Nhà ở', 'Đi lại', 'Giải trí', 'Y tế', 'Giáo dục',
+                                     'Tiết kiệm', 'Khác']),
+]
+TRANSACTION_COLUMNS = ['id', 'ngay', 'loai', 'danh_muc', 'so_tien', 'mo_ta']
+REMINDER_COLUMNS = ['id', 'name', 'due_date', 'amount', 'category', 'due_day', 'recurrence']
+# Bảng tổng hợp, cột kỳ và độ dài khóa ('YYYY-MM-DD' hoặc 'YYYY-MM') dùng cho từng kỳ ngân sách
+BUDGET_SOURCES = {
+    'weekly': ('daily_totals', 'ngay', 10),
+    'monthly': ('monthly_totals', 'thang', 7),
+    'yearly': ('monthly_totals', 'thang', 7),
+}
+# Tỉ lệ chi/ngân sách: trên ngưỡng đầu là 'warning', trên ngưỡng cuối là 'over'
+BUDGET_ALERT_THRESHOLDS = (0.8, 1.0)
+RECURRING_RULE_COLUMNS = ['id', 'name', 'loai', 'danh_muc', 'so_tien', 'mo_ta', 'frequency', 'interval',
+                          'day_of_month', 'start_day', 'end_day', 'next_day']
+# Cột của DataFrame thường trú; mo_ta được nạp riêng khi cần hiển thị
+FRAME_COLUMNS = ['id', 'ngay', 'loai', 'danh_muc', 'so_tien']
+CATEGORICAL_COLUMNS = ['loai', 'danh_muc']
+
+# Mục tiêu bộ nhớ của DataFrame giao dịch: id int64 (8) + ngay datetime64 (8)
+# + so_tien int64 (8) + mã loai/danh_muc (1-2 mỗi cột) ≈ 26 byte/dòng,
+# tức khoảng 260MB cho 10 triệu dòng. Kiểm tra bằng frame_memory_per_row().
+TARGET_BYTES_PER_ROW = 32
+# Số dòng mỗi khối khi nạp toàn bộ: đỉnh bộ nhớ do chuỗi của khối đang đọc quyết định
+LOAD_CHUNK_SIZE = 50000
+
+
+def compact_transactions(df):
+    # Chuyển một khối dòng đọc từ SQLite sang dạng cột gọn; ngay là day number (NULL -> NaT)
+    df['ngay'] = pd.to_datetime(pd.to_numeric(df['ngay']) - EPOCH_DAY, unit='D')
+    # VND không có phần lẻ nên lưu số tiền dưới dạng số nguyên (đồng)
+    df['so_tien'] = pd.to_numeric(df['so_tien']).fillna(0).round().astype('int64')
+    df['id'] = df['id'].astype('int64')
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+    return df
+
+
+def concat_transactions(parts):
+    # Đưa mọi khối về cùng tập category trước khi nối: khác tập thì pd.concat chuyển cả cột
+    # về chuỗi, khiến một delta một dòng tốn O(cả sổ). Category của khối đầu (frame thường
+    # trú) đứng trước nên mã của nó thường không phải đổi.
+    for column in CATEGORICAL_COLUMNS:
+        categories = parts[0][column].cat.categories.append(
+            [part[column].cat.categories for part in parts[1:]]).unique()
+        parts = [part if part[column].cat.categories.equals(categories)
+                 else part.assign(**{column: part[column].cat.set_categories(categories)})
+                 for part in parts]
+    return pd.concat(parts, ignore_index=True)
+
+
+def frame_memory_per_row(df):
+    # Số byte trung bình mỗi dòng (tính cả chuỗi của các category)
+    if df.empty:
+        return 0.0
+    return df.memory_usage(deep=True, index=False).sum() / len(df)
+
+
+class TransactionLoader:
+    """DataFrame giao dịch thường trú trong tiến trình, được nạp tăng dần.
+
+    Lần đầu đọc toàn bộ bảng; các lần sau chỉ đọc các dòng có ``id`` lớn hơn
+    id cuối đã thấy, cùng các dòng bị sửa/xóa ghi trong ``transaction_changes``.
+    Khi ``transactions_epoch`` thay đổi (xóa toàn bộ) hoặc change log đã bị cắt
+    qua vị trí đã đọc thì nạp lại.
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.last_id = 0
+        self.last_seq = 0
+        self.epoch = None
+        self.version = None
+        self._lock = threading.Lock()
+
+    def _read(self, conn, where='', params=()):
+        chunks = pd.read_sql(f'''
+            SELECT t.id, t.ngay, {_LOAI_SQL.format(c='c')} AS loai, c.name AS danh_muc, t.so_tien
+            FROM transactions t JOIN categories c ON c.id = t.category_id
+            {where} ORDER BY t.id
+        ''', conn, params=params, chunksize=LOAD_CHUNK_SIZE)
+        parts = [compact_transactions(chunk) for chunk in chunks]
+        if not parts:
+            return compact_transactions(pd.DataFrame(columns=FRAME_COLUMNS))
+        return parts[0] if len(parts) == 1 else concat_transactions(parts)
+
+    def _full_load(self, conn):
+        self.frame = self._read(conn)
+        self.last_id = int(self.frame['id'].max()) if not self.frame.empty else 0
+        # Lấy theo sqlite_sequence: change log có thể rỗng sau khi bị dọn
+        self.last_seq = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'transaction_changes'").fetchone()[0]
+
+    def _apply_changes(self, conn):
+        # Mục cũ nhất còn giữ; trigger đã cắt bớt các mục loader chưa đọc thì nạp lại toàn bộ
+        first_seq = conn.execute('SELECT MIN(seq) FROM transaction_changes').fetchone()[0]
+        if first_seq is not None and first_seq > self.last_seq + 1:
+            self._full_load(conn)
+            return
+        changes = conn.execute('''
+            SELECT seq, transaction_id FROM transaction_changes
+            WHERE seq > ? ORDER BY seq
+        ''', (self.last_seq,)).fetchall()
+        parts = [self.frame]
+        if changes:
+            self.last_seq = changes[-1][0]
+            changed_ids = sorted({tid for _, tid in changes if tid <= self.last_id})
+            if changed_ids:
+                # Bỏ các dòng cũ rồi đọc lại những dòng còn tồn tại (đã sửa)
+                parts[0] = self.frame[~self.frame['id'].isin(changed_ids)]
+                placeholders = ', '.join('?' * len(changed_ids))
+                parts.append(self._read(conn, f'WHERE t.id IN ({placeholders})', changed_ids))
+
+        new_rows = self._read(conn, 'WHERE t.id > ?', (self.last_id,))
+        if not new_rows.empty:
+            parts.append(new_rows)
+            self.last_id = int(new_rows['id'].max())
+
+        if len(parts) > 1:
+            parts = [part for part in parts if not part.empty] or parts[:1]
+            frame = concat_transactions(parts)
+            if len(parts) > 2 or changes:
+                frame = frame.sort_values('id', ignore_index=True)
+            self.frame = frame
+
+    def load(self, conn, version):
+        with self._lock:
+            if self.frame is not None and version == self.version:
+                return self.frame
+            # Đọc trong một giao dịch để change log và dòng mới nhất quán với nhau
+            owns_transaction = not conn.in_transaction
+            if owns_transaction:
+                conn.execute('BEGIN')
+            try:
+                epoch = conn.execute(
+                    "SELECT value FROM meta WHERE key = 'transactions_epoch'").fetchone()[0]
+                if self.frame is None or epoch != self.epoch:
+                    self._full_load(conn)
+                else:
+                    self._apply_changes(conn)
+            finally:
+                if owns_transaction:
+                    conn.rollback()
+            self.epoch = epoch
+            self.version = version
+            return self.frame
+
+
+# Một loader cho mỗi file database trong tiến trình
+_loaders = {}
+_loaders_lock = threading.Lock()
+
+
+def _get_loader(namespace):
+    with _loaders_lock:
+        loader = _loaders.get(namespace)
+        if loader is None:
+            loader = _loaders[namespace] = TransactionLoader()
+        return loader
+
+
+def _drop_loader(namespace):
+    with _loaders_lock:
+        _loaders.pop(namespace, None)
+
+
+class ConnectionPool:
+    """Pool kết nối SQLite dùng lại giữa các lần rerun của Streamlit.
+
+    Mỗi kết nối được mở một lần với WAL và các pragma ở trên, sau đó được
+    trả lại pool thay vì đóng. Trong cùng một thread, các lệnh ``with``
+    lồng nhau dùng chung một kết nối.
+    """
+
+    def __init__(self, db_name, max_size=8, cached_statements=256):
+        self.db_name = db_name
+        self.cached_statements = cached_statements
+        # ':memory:' chỉ tồn tại trong một kết nối nên không thể có nhiều kết nối
+        self.in_memory = db_name == ':memory:'
+        self.max_size = 1 if self.in_memory else max_size
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._members = set()
+        # id kết nối -> query log đang gắn hay không; đồng bộ mỗi lần lấy kết nối
+        self._traced = {}
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        if not self.in_memory:
+            conn.execute('PRAGMA journal_mode=WAL')
+        for name, value in CONNECTION_PRAGMAS.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    def _sync_query_log(self, conn):
+        # Bật/tắt query log có hiệu lực từ lần lấy kết nối tiếp theo
+        enabled = query_log.enabled
+        if self._traced.get(id(conn), False) != enabled:
+            if enabled:
+                query_log.attach(conn)
+            else:
+                query_log.detach(conn)
+            self._traced[id(conn)] = enabled
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._members) < self.max_size:
+                conn = self._connect()
+                self._members.add(id(conn))
+                return conn
+        if self.in_memory:
+            return self._idle.get()
+        # Pool đã đầy: mở kết nối tạm, sẽ được đóng khi trả về
+        return self._connect()
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if id(conn) in self._members:
+            self._idle.put(conn)
+        else:
+            self._traced.pop(id(conn), None)
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            # Lồng nhau trong cùng thread: dùng lại kết nối đang giữ
+            yield held
+            return
+
+        conn = self._acquire()
+        self._sync_query_log(conn)
+        self._local.conn = conn
+        try:
+            yield conn
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self):
+        # Đóng các kết nối rảnh; pool vẫn dùng được và sẽ mở lại khi cần
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._members.discard(id(conn))
+            self._traced.pop(id(conn), None)
+            conn.close()
+
+
+class WriteBehindWriter:
+    """Thread ghi duy nhất cho một file database, gom lệnh ghi thành group commit.
+
+    Mỗi lệnh ghi là một hàm ``op(conn)`` được đưa vào hàng đợi kèm một
+    ``Future``. Thread ghi lấy các lệnh đến trong ``window_ms`` (tối đa
+    ``max_batch`` lệnh), chạy tất cả trong một giao dịch ``BEGIN IMMEDIATE``,
+    mỗi lệnh trong một SAVEPOINT riêng để lệnh lỗi không kéo theo cả lô, rồi
+    commit một lần. Hàng đợi có giới hạn ``max_pending`` nên người gọi bị
+    chặn khi thread ghi không theo kịp. Khi tiến trình thoát, các lệnh còn
+    trong hàng đợi được ghi xong trước (atexit).
+    """
+
+    _STOP = object()
+
+    def __init__(self, pool, window_ms=WRITE_BEHIND_WINDOW_MS,
+                 max_batch=WRITE_BEHIND_MAX_BATCH, max_pending=WRITE_BEHIND_MAX_PENDING):
+        self._pool = pool
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stopped = False
+        self._stop_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='finance-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, op):
+        future = Future()
+        # Giữ khóa khi đưa vào hàng đợi để lệnh không lọt vào sau _STOP và chờ mãi
+        with self._stop_lock:
+            if self._stopped:
+                raise RuntimeError('Thread ghi đã dừng')
+            self._queue.put((op, future))  # Chặn khi hàng đợi đầy (backpressure)
+        return future
+
+    def flush(self, timeout=None):
+        # Chờ đến khi mọi lệnh đã gửi trước lời gọi này được commit. Như submit, giữ khóa
+        # khi đưa vào hàng đợi để dấu flush không lọt vào sau _STOP; stop() cũng ghi nốt hàng đợi
+        future = Future()
+        with self._stop_lock:
+            if self._stopped:
+                return
+            self._queue.put((None, future))
+        future.result(timeout)
+
+    def stop(self):
+        # Ghi nốt các lệnh đã gửi rồi dừng thread; bỏ đăng ký atexit để writer được giải phóng
+        with self._stop_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+        atexit.unregister(self.stop)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                # Lấy ngay các lệnh đã chờ sẵn; chỉ đợi thêm trong phần còn lại của cửa sổ
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            with self._pool.connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                wrote = False
+                for op, future in batch:
+                    if op is None or not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute('SAVEPOINT write_behind_op')
+                    try:
+                        outcome = (op(conn), None)
+                        wrote = True
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO write_behind_op')
+                        outcome = (None, e)
+                    conn.execute('RELEASE write_behind_op')
+                    outcomes.append((future, outcome))
+                if wrote:
+                    conn.execute(BUMP_VERSION_SQL)
+                conn.commit()
+        except Exception as e:
+            # Commit thất bại: không lệnh nào trong lô được ghi
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            metrics.record('Database.write_behind.batch',
+                           (time.perf_counter() - started) * 1000, len(batch), error=True)
+            return
+        for future, (result, error) in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        for op, future in batch:
+            if op is None:
+                future.set_result(None)
+        metrics.record('Database.write_behind.batch',
+                       (time.perf_counter() - started) * 1000, len(outcomes))
+
+
+# Một thread ghi cho mỗi file database trong tiến trình, dùng chung giữa các phiên
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _get_writer(namespace, pool):
+    with _writers_lock:
+        writer = _writers.get(namespace)
+        if writer is None or writer._stopped:
+            writer = _writers[namespace] = WriteBehindWriter(pool)
+        return writer
+
+
+def _stop_writer(namespace, writer):
+    with _writers_lock:
+        if _writers.get(namespace) is writer:
+            del _writers[namespace]
+    writer.stop()
+
+
+@instrument_methods('Database', explain=lambda db, sql: db.explain_query_plan(sql))
 class Database:
-    def __init__(self, db_name='finance.db'):
+    def __init__(self, db_name='finance.db', pool_size=8, write_behind=False):
         self.db_name = db_name
+        self._pool = ConnectionPool(db_name, max_size=pool_size)
+        self._cache_namespace = (
+            ('memory', id(self)) if db_name == ':memory:' else os.path.abspath(db_name))
         self._ensure_tables_exist()
-        self.income_categories = []
-        self.expense_categories = []
+        # write_behind: các lệnh ghi đơn lẻ đi qua thread ghi chung (group commit).
+        # Thread ghi được tạo khi ghi lần đầu và dừng khi close(), như kết nối của pool
+        self.write_behind = write_behind
+        self._writer = None
     
     @contextmanager
     def _get_connection(self):
-        conn = sqlite3.connect(self.db_name, check_same_thread=False)
-        try:
+        with self._pool.connection() as conn:
             yield conn
-        finally:
-            conn.close()
+
+    def close(self):
+        # Ghi nốt hàng đợi rồi dừng thread ghi, đóng kết nối rảnh và bỏ DataFrame thường trú;
+        # đối tượng vẫn dùng được tiếp vì thread ghi, pool và loader được tạo lại khi cần
+        if self._writer is not None:
+            _stop_writer(self._cache_namespace, self._writer)
+            self._writer = None
+        self._pool.close()
+        _drop_loader(self._cache_namespace)
+    
+    def _active_writer(self):
+        # Thread ghi dùng chung của file này; tạo lại nếu một Database khác đã close() nó
+        if self.write_behind and (self._writer is None or self._writer._stopped):
+            self._writer = _get_writer(self._cache_namespace, self._pool)
+        return self._writer
+    
+    def _write(self, op, wait=True):
+        # Chạy op(conn) rồi commit ngay, hoặc gửi cho thread ghi khi bật write_behind.
+        # wait=False trả về Future để người gọi tự chờ xác nhận.
+        if self.write_behind:
+            try:
+                future = self._active_writer().submit(op)
+            except RuntimeError:
+                # Thread ghi vừa bị dừng (shard bị loại khỏi LRU của router) trong lúc gửi
+                self._writer = None
+                future = self._active_writer().submit(op)
+            return future.result() if wait else future
+        with self._get_connection() as conn:
+            result = op(conn)
+            self._bump_version(conn)
+            conn.commit()
+        if wait:
+            return result
+        future = Future()
+        future.set_result(result)
+        return future
+    
+    def flush_writes(self):
+        # Chờ các lệnh ghi đang xếp hàng được commit (đọc ngay sau khi ghi với wait=False)
+        if self._writer is not None:
+            self._writer.flush()
     
     def _ensure_tables_exist(self):
+        # Lược đồ được tạo và nâng cấp bằng các migration có phiên bản (migrations.py)
         with self._get_connection() as conn:
-            # Bảng giao dịch
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ngay TEXT,
-                    loai TEXT,
-                    danh_muc TEXT,
-                    so_tien REAL,
-                    mo_ta TEXT
-                )
-            ''')
-            
-            # Bảng số dư ban đầu
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS balance (
-                    id INTEGER PRIMARY KEY DEFAULT 1,
-                    amount REAL DEFAULT 0
-                )
-            ''')
-            
-            # Bảng ngân sách
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS budgets (
-                    category TEXT PRIMARY KEY,
-                    amount REAL
-                )
-            ''')
-            
-            # Bảng nhắc nhở
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT,
-                    due_date TEXT,
-                    amount REAL,
-                    category TEXT
-                )
-            ''')
-            
-            # Bảng mục tiêu tiết kiệm
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS saving_goals (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT,
-                    amount REAL,
-                    target_date TEXT
-                )
+            migrate(self, conn)
+    
+    def _bump_version(self, conn):
+        conn.execute(BUMP_VERSION_SQL)
+    
+    def _reset_change_log(self, conn):
+        # Dọn change log và tăng epoch để mọi loader nạp lại từ đầu. Khi ghi bình thường
+        # change log được trigger cắt bớt (migration change_log_trim)
+        conn.execute('DELETE FROM transaction_changes')
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'transactions_epoch'")
+
+    @staticmethod
+    def _database_bytes(conn):
+        return (conn.execute('PRAGMA page_count').fetchone()[0]
+                * conn.execute('PRAGMA page_size').fetchone()[0])
+
+    def vacuum(self):
+        # Gộp segment FTS, VACUUM rồi thu gọn WAL; trả về (số byte trước, số byte sau)
+        self.flush_writes()
+        with self._get_connection() as conn:
+            before = self._database_bytes(conn)
+            conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+            conn.commit()
+            conn.execute('VACUUM')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            return before, self._database_bytes(conn)
+
+    def analyze(self):
+        # Cập nhật thống kê cho query planner (sqlite_stat1)
+        with self._get_connection() as conn:
+            conn.execute('ANALYZE')
+            conn.execute('PRAGMA optimize')
+            conn.commit()
+
+    def integrity_check(self):
+        # Trả về danh sách vấn đề; danh sách rỗng nghĩa là database toàn vẹn
+        problems = []
+        with self._get_connection() as conn:
+            problems += [row[0] for row in conn.execute('PRAGMA integrity_check') if row[0] != 'ok']
+            problems += [f'khóa ngoại: {table} dòng {rowid} -> {parent}'
+                         for table, rowid, parent, _ in conn.execute('PRAGMA foreign_key_check')]
+            try:
+                conn.execute("INSERT INTO transactions_fts (transactions_fts, rank) VALUES ('integrity-check', 0)")
+            except sqlite3.DatabaseError as e:
+                problems.append(f'transactions_fts: {e}')
+            conn.rollback()
+        problems += [f'{table}: {bad} dòng lệch' for table, bad in self.verify_aggregates().items()]
+        return problems
+
+    def explain_query_plan(self, sql, params=()):
+        with self._get_connection() as conn:
+            return [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+    
+    def data_version(self):
+        with self._get_connection() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()[0]
+    
+    def _create_aggregate_tables(self, conn, replace=False):
+        for table, keys in AGGREGATE_TABLES.items():
+            if replace:
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+            key_columns = ', '.join(column for column, _ in keys)
+            column_defs = ''.join(f'{column} TEXT NOT NULL, ' for column, _ in keys)
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {column_defs}so_tien INTEGER NOT NULL DEFAULT 0,
+                    so_luong INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY ({key_columns})
+                ) STRICT, WITHOUT ROWID
             ''')
-            
-            # Bảng danh mục
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    type TEXT,
-                    name TEXT,
-                    UNIQUE(type, name)
-                )
+        
+        add_new = '\n'.join(_aggregate_apply_sql(t, k, 'NEW', '+') for t, k in AGGREGATE_TABLES.items())
+        remove_old = '\n'.join(_aggregate_apply_sql(t, k, 'OLD', '-') for t, k in AGGREGATE_TABLES.items())
+        # Khi ghi hàng loạt (add_transactions), trigger insert được tắt và bảng
+        # tổng hợp được cộng dồn một lần bằng _apply_aggregate_delta
+        for name in ('insert', 'delete', 'update'):
+            conn.execute(f'DROP TRIGGER IF EXISTS trg_transactions_aggregate_{name}')
+        conn.execute(f'''
+            CREATE TRIGGER trg_transactions_aggregate_insert
+            AFTER INSERT ON transactions
+            WHEN (SELECT value FROM meta WHERE key = 'aggregates_deferred') = 0
+            BEGIN
+            {add_new}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_transactions_aggregate_delete
+            AFTER DELETE ON transactions BEGIN
+            {remove_old}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_transactions_aggregate_update
+            AFTER UPDATE OF ngay, category_id, so_tien ON transactions BEGIN
+            {remove_old}
+            {add_new}
+            END
+        ''')
+    
+    def _aggregate_queries(self, where=''):
+        # Truy vấn tính lại từng bảng tổng hợp trực tiếp từ bảng transactions
+        queries = {}
+        for table, keys in AGGREGATE_TABLES.items():
+            exprs = ', '.join(expr.format(r='t', c='c') for _, expr in keys)
+            group_by = ', '.join(str(i + 1) for i in range(len(keys)))
+            queries[table] = f'''
+                SELECT {exprs}, SUM(t.so_tien), COUNT(*)
+                FROM transactions t JOIN categories c ON c.id = t.category_id
+                {where} GROUP BY {group_by}
+            '''
+        return queries
+    
+    def _apply_aggregate_delta(self, conn, after_id):
+        # Cộng các giao dịch có id > after_id vào bảng tổng hợp: gom theo ngày một
+        # lần vào bảng tạm rồi cuộn lên từng bảng tổng hợp
+        daily_query = self._aggregate_queries('WHERE t.id > ?')['daily_totals']
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS aggregate_delta (loai, ngay, danh_muc, so_tien, so_luong)')
+        conn.execute('DELETE FROM temp.aggregate_delta')
+        conn.execute(f'INSERT INTO temp.aggregate_delta {daily_query}', (after_id,))
+        rollup = {'loai': 'loai', 'ngay': 'ngay', 'danh_muc': 'danh_muc', 'thang': 'substr(ngay, 1, 7)'}
+        for table, keys in AGGREGATE_TABLES.items():
+            key_columns = ', '.join(column for column, _ in keys)
+            exprs = ', '.join(rollup[column] for column, _ in keys)
+            group_by = ', '.join(str(i + 1) for i in range(len(keys)))
+            conn.execute(f'''
+                INSERT INTO {table} ({key_columns}, so_tien, so_luong)
+                SELECT {exprs}, SUM(so_tien), SUM(so_luong) FROM temp.aggregate_delta
+                WHERE true GROUP BY {group_by}
+                ON CONFLICT ({key_columns}) DO UPDATE SET
+                    so_tien = so_tien + excluded.so_tien,
+                    so_luong = so_luong + excluded.so_luong
             ''')
-            
+        conn.execute('DELETE FROM temp.aggregate_delta')
+    
+    def _rebuild_aggregates(self, conn):
+        for table, query in self._aggregate_queries().items():
+            columns = ', '.join(column for column, _ in AGGREGATE_TABLES[table])
+            conn.execute(f'DELETE FROM {table}')
+            conn.execute(f'INSERT INTO {table} ({columns}, so_tien, so_luong) {query}')
+    
+    def rebuild_aggregates(self):
+        with self._get_connection() as conn:
+            self._rebuild_aggregates(conn)
+            self._bump_version(conn)
             conn.commit()
     
+    def verify_aggregates(self, tolerance=1e-6):
+        # Trả về {bảng: số dòng lệch}; dict rỗng nghĩa là các bảng tổng hợp khớp
+        mismatches = {}
+        with self._get_connection() as conn:
+            # Giao dịch không có ngày nằm ở khóa ngày/tháng '' và phải được đếm đúng ở đó,
+            # vì các báo cáo theo kỳ bỏ khóa này (get_period_summary, get_daily_expenses)
+            undated = conn.execute('SELECT COUNT(*) FROM transactions WHERE ngay IS NULL').fetchone()[0]
+            for table, column in (('daily_totals', 'ngay'), ('monthly_totals', 'thang')):
+                counted = conn.execute(
+                    f"SELECT COALESCE(SUM(so_luong), 0) FROM {table} WHERE {column} = ''").fetchone()[0]
+                if counted != undated:
+                    mismatches[f'{table} (không có ngày)'] = abs(counted - undated)
+            for table, query in self._aggregate_queries().items():
+                n_keys = len(AGGREGATE_TABLES[table])
+                expected = {row[:n_keys]: row[n_keys:] for row in conn.execute(query)}
+                actual = {row[:n_keys]: row[n_keys:] for row in conn.execute(f'SELECT * FROM {table}')}
+                bad = 0
+                for key in expected.keys() | actual.keys():
+                    exp_sum, exp_count = expected.get(key, (0, 0))
+                    act_sum, act_count = actual.get(key, (0, 0))
+                    if exp_count != act_count or abs(exp_sum - act_sum) > tolerance * max(1, abs(exp_sum)):
+                        bad += 1
+                if bad:
+                    mismatches[table] = bad
+        return mismatches
+    
     def load_categories(self):
+        # Thêm các danh mục mặc định còn thiếu trong một lệnh ghi; không ghi gì nếu đã đủ
+        existing = set(self.list_categories())
+        missing = [category for category in DEFAULT_CATEGORIES if category not in existing]
+        if missing:
+            self.add_categories(missing)
+    
+    @property
+    def income_categories(self):
+        # Suy ra từ list_categories nên được cache chung giữa các phiên và tự làm mới theo data_version
+        return [name for category_type, name in self.list_categories() if category_type == 'income']
+    
+    @property
+    def expense_categories(self):
+        return [name for category_type, name in self.list_categories() if category_type == 'expense']
+    
+    def add_category(self, category_type, name):
+        self.add_categories([(category_type, name)])
+    
+    def add_categories(self, categories):
+        # categories: danh sách (type, name); bỏ qua các danh mục đã tồn tại
         with self._get_connection() as conn:
-            # Load existing categories
-            self.income_categories = [row[0] for row in 
-                conn.execute("SELECT name FROM categories WHERE type = 'income'")]
-            self.expense_categories = [row[0] for row in 
-                conn.execute("SELECT name FROM categories WHERE type = 'expense'")]
-            
-            print("[DEBUG] Danh mục thu từ database:", self.income_categories)  # <-- Thêm dòng này
-            print("[DEBUG] Danh mục chi từ database:", self.expense_categories)  # <-- Thêm dòng này
+            conn.executemany('INSERT OR IGNORE INTO categories (type, name) VALUES (?, ?)',
+                             categories)
+            self._bump_version(conn)
+            conn.commit()
+    
+    @cached_query
+    def list_categories(self):
+        with self._get_connection() as conn:
+            return conn.execute('SELECT type, name FROM categories ORDER BY id').fetchall()
+    
+    def add_initial_balance(self, amount, wait=True):
+        return self._write(lambda conn: conn.execute(
+            'INSERT OR REPLACE INTO balance (id, amount) VALUES (1, ?)', (amount,)).rowcount, wait)
+    
+    def _encode_transactions(self, conn, rows, references=None):
+        """Chuyển các bộ (ngay, loai, danh_muc, so_tien, mo_ta, ...) sang dạng lưu trữ
+        (ngay day number, category_id, so_tien nguyên đồng, mo_ta, fingerprint, ...).
 
+        Cặp (loại, danh mục) chưa có được thêm vào categories như khi migration
+        chuyển dữ liệu cũ. ``references``: mã tham chiếu ngoài của từng dòng,
+        chỉ dùng để tính fingerprint.
+        """
+        keys = [(CATEGORY_TYPES.get(row[1], row[1] or ''), row[2] or '') for row in rows]
+        conn.executemany('INSERT OR IGNORE INTO categories (type, name) VALUES (?, ?)', set(keys))
+        category_ids = {(t, n): i for i, t, n in conn.execute('SELECT id, type, name FROM categories')}
+        encoded = []
+        for i, (row, key) in enumerate(zip(rows, keys)):
+            day, category_id, amount = encode_day(row[0]), category_ids[key], round(float(row[3] or 0))
+            fingerprint = transaction_fingerprint(day, category_id, amount, row[4],
+                                                  references[i] if references else None)
+            encoded.append((day, category_id, amount, row[4], fingerprint, *row[5:]))
+        return encoded
+    
+    def _fingerprint_counts(self, conn, fingerprints, start_id=None):
+        # {fingerprint: (số dòng id <= start_id, số dòng id > start_id)}; mỗi giá trị một lần tra index
+        start_id = MAX_ROW_ID if start_id is None else start_id
+        counts = {}
+        distinct = list(set(fingerprints))
+        for start in range(0, len(distinct), FINGERPRINT_LOOKUP_CHUNK):
+            chunk = distinct[start:start + FINGERPRINT_LOOKUP_CHUNK]
+            for fingerprint, existing, written in conn.execute(f'''
+                SELECT fingerprint, SUM(id <= ?), SUM(id > ?) FROM transactions
+                WHERE fingerprint IN ({', '.join('?' * len(chunk))})
+                GROUP BY fingerprint
+            ''', [start_id, start_id] + chunk):
+                counts[fingerprint] = (existing, written)
+        return counts
+    
+    def _apply_duplicate_policy(self, conn, encoded, on_duplicate, deduplicator=None):
+        # Lọc các dòng đã mã hóa theo DUPLICATE_POLICIES (fingerprint ở vị trí 4)
+        if on_duplicate not in DUPLICATE_POLICIES:
+            raise ValueError(f'Chính sách trùng lặp không hợp lệ: {on_duplicate}')
+        if on_duplicate == 'allow' or not encoded:
+            return encoded
+        deduplicator = deduplicator or Deduplicator()
+        fingerprints = [row[4] for row in encoded]
+        mask = deduplicator.mask(fingerprints,
+                                 self._fingerprint_counts(conn, fingerprints, deduplicator.start_id))
+        if on_duplicate == 'reject' and not all(mask):
+            raise DuplicateTransactionError([i for i, keep in enumerate(mask) if not keep])
+        return [row for row, keep in zip(encoded, mask) if keep]
+    
+    def deduplicator(self):
+        # Cho một lần nhập nhiều khối với on_duplicate='skip' (xem dedupe.Deduplicator)
+        with self._get_connection() as conn:
+            return Deduplicator(conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0])
+    
+    def add_transaction(self, date, trans_type, category, amount, description, wait=True,
+                        on_duplicate='allow', reference=None):
+        # Trả về id của giao dịch mới, hoặc None khi bị bỏ vì trùng (on_duplicate='skip')
+        def insert(conn):
+            encoded = self._apply_duplicate_policy(conn, self._encode_transactions(
+                conn, [(date, trans_type, category, amount, description)], [reference]), on_duplicate)
+            if not encoded:
+                return None
+            return conn.execute(INSERT_TRANSACTION_SQL, encoded[0]).lastrowid
+        return self._write(insert, wait)
+    
+    @contextmanager
+    def _deferred_aggregates(self, conn):
+        # Ghi hàng loạt với trigger tổng hợp tạm tắt, cộng phần chênh một lần ở cuối.
+        # Lệnh UPDATE đầu tiên giữ khóa ghi, nên kiểm tra trùng không bị phiên khác chen vào
+        # và mọi id mới đều lớn hơn last_id
+        conn.execute("UPDATE meta SET value = 1 WHERE key = 'aggregates_deferred'")
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+        yield
+        self._apply_aggregate_delta(conn, last_id)
+        conn.execute("UPDATE meta SET value = 0 WHERE key = 'aggregates_deferred'")
+    
+    def _bulk_insert(self, conn, sql, rows, references=None, on_duplicate='allow', deduplicator=None):
+        # rows theo dạng hiển thị, được mã hóa bằng _encode_transactions
+        with self._deferred_aggregates(conn):
+            encoded = self._apply_duplicate_policy(
+                conn, self._encode_transactions(conn, rows, references), on_duplicate, deduplicator)
+            return conn.executemany(sql, encoded).rowcount
+    
+    def add_transaction_groups(self, groups):
+        """Ghi lần lượt các nhóm (rows, on_duplicate) trong một giao dịch, như khi ghi riêng từng nhóm.
+
+        Nhóm sau thấy các dòng nhóm trước đã ghi, nên cùng một dòng gửi trong hai
+        nhóm với 'skip' chỉ được ghi một lần dù hai nhóm đến cùng lô hay khác lô.
+        Nhóm 'reject' có dòng trùng không ghi gì và không ảnh hưởng các nhóm khác.
+        Trả về danh sách theo nhóm: số dòng đã ghi, hoặc DuplicateTransactionError.
+        """
+        self.flush_writes()
+        results = []
+        with self._get_connection() as conn:
+            with self._deferred_aggregates(conn):
+                for rows, on_duplicate in groups:
+                    references = [row[5] if len(row) > 5 else None for row in rows]
+                    try:
+                        encoded = self._apply_duplicate_policy(conn, self._encode_transactions(
+                            conn, [row[:5] for row in rows], references), on_duplicate)
+                    except DuplicateTransactionError as e:
+                        results.append(e)
+                        continue
+                    results.append(conn.executemany(INSERT_TRANSACTION_SQL, encoded).rowcount)
+            self._bump_version(conn)
+            conn.commit()
+        return results
+    
+    def add_transactions(self, rows, on_duplicate='allow', deduplicator=None):
+        """Ghi các bộ (ngay, loai, danh_muc, so_tien, mo_ta[, ma_tham_chieu]) trong một giao dịch.
 
-            # Thêm danh mục thu mặc định nếu chưa tồn tại
-            default_income = ['Lương', 'Thưởng', 'Đầu tư', 'Kinh doanh', 'Quà tặng', 'Khác']
-            for cat in default_income:
-                if cat not in self.income_categories:
-                    self.add_category('income', cat)  # Chỉ thêm nếu chưa có
+        on_duplicate: xem dedupe.DUPLICATE_POLICIES; 'skip' làm việc nhập lại
+        cùng dữ liệu trở thành idempotent. Nhập một file theo nhiều khối thì
+        truyền cùng một ``deduplicator()`` cho mọi khối. Trả về số dòng đã ghi.
+        """
+        self.flush_writes()
+        references = [row[5] if len(row) > 5 else None for row in rows]
+        with self._get_connection() as conn:
+            inserted = self._bulk_insert(conn, INSERT_TRANSACTION_SQL, [row[:5] for row in rows],
+                                         references, on_duplicate, deduplicator)
+            self._bump_version(conn)
+            conn.commit()
+            return inserted
+    
+    def add_recurring_rule(self, name, trans_type, category, amount, frequency, start_date,
+                           interval=1, day_of_month=None, end_date=None, description=''):
+        """Thêm quy tắc giao dịch định kỳ (tiền nhà, lương, thuê bao...).
+
+        frequency: 'daily', 'weekly', 'monthly' hoặc 'yearly', lặp mỗi ``interval``
+        chu kỳ; day_of_month cố định ngày trong tháng cho 'monthly'/'yearly'.
+        Trả về id của quy tắc.
+        """
+        if frequency not in FREQUENCIES:
+            raise ValueError(f'Tần suất không hợp lệ: {frequency}')
+        if interval < 1:
+            raise ValueError('interval phải lớn hơn 0')
+        start_day = day_number(start_date)
+        end_day = day_number(end_date) if end_date else None
+        next_day = next_occurrence(start_day, frequency, start_day, interval, day_of_month)
+        if end_day is not None and next_day > end_day:
+            next_day = None
+        return self._write(lambda conn: conn.execute('''
+            INSERT INTO recurring_rules (name, loai, danh_muc, so_tien, mo_ta, frequency,
+                                         interval, day_of_month, start_day, end_day, next_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (name, trans_type, category, amount, description, frequency,
+              interval, day_of_month, start_day, end_day, next_day)).lastrowid)
+    
+    def end_recurring_rule(self, rule_id):
+        # Dừng quy tắc; các giao dịch đã sinh được giữ nguyên
+        return self._write(lambda conn: conn.execute(
+            'UPDATE recurring_rules SET next_day = NULL WHERE id = ?', (rule_id,)).rowcount)
+    
+    @cached_query
+    def get_recurring_rules(self):
+        with self._get_connection() as conn:
+            rules = pd.read_sql(f'''
+                SELECT {', '.join(RECURRING_RULE_COLUMNS)} FROM recurring_rules ORDER BY id
+            ''', conn)
+        for column in ['start_day', 'end_day', 'next_day']:
+            rules[column.replace('_day', '_date')] = [
+                from_day_number(int(day)).isoformat() if pd.notna(day) else None for day in rules[column]]
+        return rules
+    
+    def _expand_rules(self, rules, start_day, end_day):
+        # Các lần phát sinh của những quy tắc (dòng recurring_rules) trong [start_day, end_day]
+        rows = []
+        for (rule_id, _, loai, danh_muc, so_tien, mo_ta, frequency, interval,
+             day_of_month, rule_start, rule_end, next_day) in rules:
+            last_day = end_day if rule_end is None else min(end_day, rule_end)
+            for day in occurrences(rule_start, frequency, max(start_day, next_day), last_day,
+                                   interval, day_of_month):
+                rows.append((day, loai, danh_muc, so_tien, mo_ta, rule_id))
+        return rows
+    
+    def materialize_recurring(self, today=None):
+        """Ghi mọi lần phát sinh đã đến hạn (tới hết ``today``) của các quy tắc định kỳ.
 
-            # Thêm danh mục chi mặc định nếu chưa tồn tại
-            default_expense = ['Ăn uống', 'Nhà ở', 'Đi lại', 'Giải trí', 'Y tế', 'Giáo dục', 'Tiết kiệm', 'Khác']
-            for cat in default_expense:
-                if cat not in self.expense_categories:
-                    self.add_category('expense', cat)  # Chỉ thêm nếu chưa có
+        Các quy tắc đến hạn được tìm bằng index trên next_day và ghi trong một
+        lần ghi hàng loạt. Gọi lặp lại hoặc đồng thời không tạo bản ghi trùng:
+        BEGIN IMMEDIATE tuần tự hóa các lần chạy và index UNIQUE (recurring_id, ngay)
+        bỏ qua dòng đã có. Trả về số giao dịch đã thêm.
+        """
+        today = today_number() if today is None else day_number(today)
+        columns = ', '.join(RECURRING_RULE_COLUMNS)
+        with self._get_connection() as conn:
+            # Kiểm tra nhanh không cần khóa ghi: thường không có quy tắc nào đến hạn
+            if conn.execute('SELECT 1 FROM recurring_rules WHERE next_day <= ? LIMIT 1',
+                            (today,)).fetchone() is None:
+                return 0
+        self.flush_writes()
+        with self._get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rules = conn.execute(f'SELECT {columns} FROM recurring_rules WHERE next_day <= ?',
+                                 (today,)).fetchall()
+            inserted = self._bulk_insert(conn, '''
+                INSERT OR IGNORE INTO transactions (ngay, category_id, so_tien, mo_ta, fingerprint, recurring_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', self._expand_rules(rules, 0, today))
+            advanced = []
+            for rule in rules:
+                next_day = next_occurrence(rule[9], rule[6], today + 1, rule[7], rule[8])
+                if rule[10] is not None and next_day > rule[10]:
+                    next_day = None
+                advanced.append((next_day, rule[0]))
+            conn.executemany('UPDATE recurring_rules SET next_day = ? WHERE id = ?', advanced)
+            self._bump_version(conn)
+            conn.commit()
+            return inserted
+    
+    @cached_query
+    def project_recurring(self, start, end):
+        # Các lần phát sinh tương lai trong [start, end] tính trên bộ nhớ, không ghi vào database
+        columns = ', '.join(RECURRING_RULE_COLUMNS)
+        start_day, end_day = day_number(start), day_number(end)
+        with self._get_connection() as conn:
+            rules = conn.execute(f'SELECT {columns} FROM recurring_rules WHERE next_day <= ?',
+                                 (end_day,)).fetchall()
+        projected = pd.DataFrame.from_records(
+            self._expand_rules(rules, start_day, end_day),
+            columns=['ngay', 'loai', 'danh_muc', 'so_tien', 'mo_ta', 'recurring_id'])
+        projected['ngay'] = pd.to_datetime(projected['ngay'] - EPOCH_DAY, unit='D')
+        return projected.sort_values(['ngay', 'recurring_id'], ignore_index=True)
+    
+    @staticmethod
+    def _aggregate_filters(loai=None, danh_muc=None, start=None, end=None):
+        # Bộ lọc của trang lịch sử trên daily_totals (loai, ngay 'YYYY-MM-DD', danh_muc).
+        # Dòng không có ngày nằm ở ngay '' và, như query_transactions, bị bộ lọc ngày loại ra
+        clauses, params = [], []
+        if loai is not None:
+            clauses.append('loai = ?')
+            params.append(loai)
+        if danh_muc is not None:
+            clauses.append('danh_muc = ?')
+            params.append(danh_muc)
+        if start is not None:
+            clauses.append('ngay >= ?')
+            params.append(str(start)[:10])
+        if end is not None:
+            clauses.append("ngay <= ? AND ngay <> ''")
+            params.append(str(end)[:10])
+        where = 'WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return where, params
+    
+    @staticmethod
+    def _transaction_filters(conn, loai=None, danh_muc=None, start=None, end=None):
+        # Bộ lọc của trang lịch sử trên bảng transactions t: loại và danh mục được
+        # đổi thành danh sách category_id, ngày thành day number
+        clauses, params = [], []
+        if loai is not None or danh_muc is not None:
+            sql, args = 'SELECT id FROM categories WHERE true', []
+            if loai is not None:
+                sql += ' AND type = ?'
+                args.append(CATEGORY_TYPES.get(loai, loai))
+            if danh_muc is not None:
+                sql += ' AND name = ?'
+                args.append(danh_muc)
+            ids = [row[0] for row in conn.execute(sql, args)]
+            # Chỉ lọc theo loại thì có nhiều danh mục: dấu + bỏ qua index category_id
+            # để trang mới nhất vẫn được đọc theo thứ tự của index ngay
+            column = 't.category_id' if danh_muc is not None else '+t.category_id'
+            clauses.append(f"{column} IN ({', '.join('?' * len(ids))})")
+            params += ids
+        if start is not None:
+            clauses.append('t.ngay >= ?')
+            params.append(day_number(start))
+        if end is not None:
+            clauses.append('t.ngay <= ?')
+            params.append(day_number(end))
+        where = 'WHERE ' + ' AND '.join(clauses) if clauses else ''
+        return where, params
+    
+    @staticmethod
+    def _transaction_columns():
+        # TRANSACTION_COLUMNS ở dạng hiển thị (ngày ISO, loại Thu/Chi, tên danh mục)
+        return (f"t.id, {_DATE_SQL.format(r='t')} AS ngay, {_LOAI_SQL.format(c='c')} AS loai, "
+                "c.name AS danh_muc, t.so_tien, t.mo_ta")
+    
+    def query_transactions(self, after=None, limit=50, **filters):
+        """Một trang giao dịch mới nhất trước, phân trang keyset theo (ngay, id).
 
-            print("[DEBUG] Income categories after load:", self.income_categories)
-            print("[DEBUG] Expense categories after load:", self.expense_categories)
-            print("[DEBUG] Danh mục chi trong database:", self.expense_categories)
+        ``after`` là con trỏ (day number, id) của dòng cuối trang trước. Dòng không
+        có ngày (ngày cũ không đọc được, xem migration compact_transactions) xếp
+        cuối theo id giảm dần; con trỏ của chúng là (None, id). Trả về
+        (DataFrame, con trỏ trang sau hoặc None nếu đã hết).
+        """
+        with self._get_connection() as conn:
+            where, params = self._transaction_filters(conn, **filters)
             
-            # Thêm danh mục mặc định
-            for cat in default_income:
-                if cat not in self.income_categories:
-                    print(f"[DEBUG] Adding income category: {cat}")
-                    self.add_category('income', cat)
+            def read(condition, condition_params, count):
+                clause = (where + ' AND ' if where else 'WHERE ') + condition
+                return conn.execute(f'''
+                    SELECT {self._transaction_columns()}, t.ngay
+                    FROM transactions t JOIN categories c ON c.id = t.category_id {clause}
+                    ORDER BY t.ngay DESC, t.id DESC
+                    LIMIT ?
+                ''', params + condition_params + [count]).fetchall()
             
-            for cat in default_expense:
-                if cat not in self.expense_categories:
-                    print(f"[DEBUG] Adding expense category: {cat}")
-                    self.add_category('expense', cat)  # <-- Đảm bảo đúng chính tả
+            # So sánh (ngay, id) < (?, ?) không bao giờ đúng với ngay NULL, nên phần dòng
+            # không có ngày được đọc bằng truy vấn riêng khi đã hết dòng có ngày
+            rows = []
+            if after is None or after[0] is not None:
+                rows = read('(t.ngay, t.id) < (?, ?)' if after is not None else 't.ngay IS NOT NULL',
+                            list(after) if after is not None else [], limit + 1)
+            if len(rows) <= limit and filters.get('start') is None and filters.get('end') is None:
+                before_id = after[1] if after is not None and after[0] is None else MAX_ROW_ID
+                rows += read('t.ngay IS NULL AND t.id < ?', [before_id], limit + 1 - len(rows))
+        page = pd.DataFrame.from_records([row[:-1] for row in rows[:limit]], columns=TRANSACTION_COLUMNS)
+        page['ngay'] = pd.to_datetime(page['ngay'])
+        next_cursor = (rows[limit - 1][-1], rows[limit - 1][0]) if len(rows) > limit else None
+        return page, next_cursor
     
-    def add_category(self, category_type, name):
+    @cached_query
+    def count_transactions(self, **filters):
+        # Đếm qua daily_totals nên chi phí theo số ngày x danh mục, không theo số giao dịch
+        where, params = self._aggregate_filters(**filters)
         with self._get_connection() as conn:
-            try:
-                conn.execute("INSERT INTO categories (type, name) VALUES (?, ?)", 
-                            (category_type, name))
-                conn.commit()
-                
-                if category_type == 'income':
-                    self.income_categories.append(name)
-                else:
-                    self.expense_categories.append(name)
-            except sqlite3.IntegrityError:
-                pass
+            return conn.execute(
+                f'SELECT COALESCE(SUM(so_luong), 0) FROM daily_totals {where}', params).fetchone()[0]
     
-    def add_initial_balance(self, amount):
+    def search_transactions(self, text, after=None, limit=50, **filters):
+        """Tìm giao dịch theo mô tả qua chỉ mục FTS5, kết hợp các bộ lọc của trang lịch sử.
+
+        Kết quả xếp theo độ liên quan (bm25). Khi từ khóa khớp hơn
+        SEARCH_RANK_MAX_MATCHES mô tả, chấm điểm mọi kết quả sẽ mất hàng trăm ms
+        nên kết quả được xếp theo giao dịch mới thêm trước, đọc thẳng theo rowid
+        của chỉ mục. ``after`` là vị trí (offset) của trang; trả về (DataFrame,
+        offset trang sau hoặc None).
+        """
+        match = search_match_query(text)
+        if match is None:
+            return pd.DataFrame(columns=TRANSACTION_COLUMNS), None
+        offset = after = after or 0
         with self._get_connection() as conn:
-            conn.execute('INSERT OR REPLACE INTO balance (id, amount) VALUES (1, ?)', (amount,))
-            conn.commit()
+            matches = conn.execute('SELECT COUNT(*) FROM transactions_fts WHERE transactions_fts MATCH ?',
+                                   (match,)).fetchone()[0]
+            order = 'f.rank, f.rowid DESC' if matches <= SEARCH_RANK_MAX_MATCHES else 'f.rowid DESC'
+            where, params = self._transaction_filters(conn, **filters)
+            if where:
+                # CROSS JOIN giữ chỉ mục FTS ở vòng ngoài: nếu không, với bộ lọc danh mục SQLite
+                # có thể duyệt transactions trước rồi đánh giá MATCH cho từng dòng
+                source = 'transactions_fts f'
+                where = 'WHERE transactions_fts MATCH ? AND ' + where[len('WHERE '):]
+            else:
+                # Không có bộ lọc: chọn trang ngay trên chỉ mục rồi mới đọc các dòng của trang
+                source = f'''(
+                    SELECT rowid, rank FROM transactions_fts f WHERE transactions_fts MATCH ?
+                    ORDER BY {order} LIMIT ? OFFSET ?
+                ) f'''
+                params = [limit + 1, after]
+                after = 0
+            rows = conn.execute(f'''
+                SELECT {self._transaction_columns()}
+                FROM {source}
+                CROSS JOIN transactions t ON t.id = f.rowid
+                JOIN categories c ON c.id = t.category_id
+                {where}
+                ORDER BY {order}
+                LIMIT ? OFFSET ?
+            ''', [match] + params + [limit + 1, after]).fetchall()
+        page = pd.DataFrame.from_records(rows[:limit], columns=TRANSACTION_COLUMNS)
+        page['ngay'] = pd.to_datetime(page['ngay'])
+        return page, (offset + limit if len(rows) > limit else None)
     
-    def add_transaction(self, date, trans_type, category, amount, description):
+    @cached_query
+    def count_search_results(self, text, **filters):
+        match = search_match_query(text)
+        if match is None:
+            return 0
         with self._get_connection() as conn:
-            conn.execute('''
-                INSERT INTO transactions (ngay, loai, danh_muc, so_tien, mo_ta)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (date, trans_type, category, amount, description))
-            conn.commit()
+            where, params = self._transaction_filters(conn, **filters)
+            if not where:
+                # Không có bộ lọc: đếm trực tiếp trên chỉ mục, không cần đọc bảng transactions
+                return conn.execute('SELECT COUNT(*) FROM transactions_fts WHERE transactions_fts MATCH ?',
+                                    (match,)).fetchone()[0]
+            return conn.execute(f'''
+                SELECT COUNT(*) FROM transactions_fts f CROSS JOIN transactions t ON t.id = f.rowid
+                WHERE transactions_fts MATCH ? AND {where[len('WHERE '):]}
+            ''', [match] + params).fetchone()[0]
+    
+    @cached_query
+    def get_date_range(self):
+        with self._get_connection() as conn:
+            return conn.execute(f'''
+                SELECT date(MIN(ngay) + {JULIAN_DAY_OFFSET}), date(MAX(ngay) + {JULIAN_DAY_OFFSET})
+                FROM transactions
+            ''').fetchone()
+    
+    def iter_transactions(self, chunk_size=50000, **filters):
+        # Đọc giao dịch (kèm mô tả) theo từng khối DataFrame, không giữ toàn bộ bảng
+        with self._get_connection() as conn:
+            where, params = self._transaction_filters(conn, **filters)
+            cursor = conn.execute(f'''
+                SELECT {self._transaction_columns()}
+                FROM transactions t JOIN categories c ON c.id = t.category_id {where}
+                ORDER BY t.id
+            ''', params)
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield pd.DataFrame.from_records(rows, columns=TRANSACTION_COLUMNS)
+            finally:
+                cursor.close()
     
     def load_transactions(self):
+        loader = _get_loader(self._cache_namespace)
         with self._get_connection() as conn:
             try:
-                return pd.read_sql('SELECT * FROM transactions', conn, parse_dates=['ngay'])
+                return loader.load(conn, self.data_version()).copy(deep=False)
             except:
-                return pd.DataFrame(columns=['id', 'ngay', 'loai', 'danh_muc', 'so_tien', 'mo_ta'])
+                return pd.DataFrame(columns=FRAME_COLUMNS)
     
-    def get_balance(self):
+    def get_descriptions(self, ids):
+        # Trả về {id: mo_ta} cho các giao dịch cần hiển thị mô tả
+        ids = [int(i) for i in ids]
+        descriptions = {}
+        with self._get_connection() as conn:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ', '.join('?' * len(batch))
+                descriptions.update(conn.execute(
+                    f'SELECT id, mo_ta FROM transactions WHERE id IN ({placeholders})', batch))
+        return descriptions
+    
+    def attach_descriptions(self, transactions):
+        # Thêm cột mo_ta cho một tập dòng nhỏ (trang hiển thị, file xuất)
+        df = transactions.copy()
+        df['mo_ta'] = df['id'].map(self.get_descriptions(df['id'])).astype(object)
+        return df
+    
+    @cached_query
+    def get_initial_balance(self):
         with self._get_connection() as conn:
             balance = conn.execute('SELECT amount FROM balance WHERE id = 1').fetchone()
-            if balance:
-                initial_balance = balance[0]
-            else:
-                initial_balance = 0
-            
-            transactions = pd.read_sql('SELECT * FROM transactions', conn)
-            if not transactions.empty:
-                income = transactions[transactions['loai'] == 'Thu']['so_tien'].sum()
-                expense = transactions[transactions['loai'] == 'Chi']['so_tien'].sum()
-                return initial_balance + income - expense
-            return initial_balance
+            return balance[0] if balance else 0
+    
+    @cached_query
+    def get_totals(self):
+        with self._get_connection() as conn:
+            totals = dict(conn.execute('SELECT loai, so_tien FROM totals').fetchall())
+            return {'income': totals.get('Thu', 0), 'expense': totals.get('Chi', 0)}
+    
+    @cached_query
+    def get_transaction_count(self):
+        with self._get_connection() as conn:
+            return conn.execute('SELECT COALESCE(SUM(so_luong), 0) FROM totals').fetchone()[0]
     
+    @cached_query
+    def duplicate_summary(self):
+        """Số nhóm giao dịch trùng fingerprint, số dòng thừa và số tiền bị tính thừa.
+
+        GROUP BY đọc một lượt index fingerprint, không so sánh từng cặp dòng.
+        """
+        with self._get_connection() as conn:
+            groups, extra_rows, extra_amount = conn.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM(d.so_luong - 1), 0), COALESCE(SUM((d.so_luong - 1) * t.so_tien), 0)
+                FROM ({self._duplicate_groups_sql()}) d JOIN transactions t ON t.id = d.first_id
+            ''').fetchone()
+        return {'groups': groups, 'extra_rows': extra_rows, 'extra_amount': extra_amount}
+    
+    @cached_query
+    def find_duplicates(self, limit=100):
+        # Các nhóm trùng nhiều bản nhất: dòng đầu tiên của nhóm, số bản và id các bản
+        with self._get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {self._transaction_columns()}, d.so_luong, d.ids
+                FROM ({self._duplicate_groups_sql()} ORDER BY so_luong DESC LIMIT ?) d
+                JOIN transactions t ON t.id = d.first_id
+                JOIN categories c ON c.id = t.category_id
+                ORDER BY d.so_luong DESC, t.ngay DESC
+            ''', (limit,)).fetchall()
+        duplicates = pd.DataFrame.from_records(rows, columns=TRANSACTION_COLUMNS + ['so_luong', 'ids'])
+        duplicates['ids'] = [sorted(int(i) for i in ids.split(',')) for ids in duplicates['ids']]
+        duplicates['so_tien_thua'] = duplicates['so_tien'] * (duplicates['so_luong'] - 1)
+        return duplicates
+    
+    @staticmethod
+    def _duplicate_groups_sql():
+        return '''
+            SELECT fingerprint, COUNT(*) AS so_luong, MIN(id) AS first_id, group_concat(id) AS ids
+            FROM transactions WHERE fingerprint IS NOT NULL
+            GROUP BY fingerprint HAVING COUNT(*) > 1
+        '''
+    
+    def get_balance(self):
+        totals = self.get_totals()
+        return self.get_initial_balance() + totals['income'] - totals['expense']
+    
+    @cached_query
     def get_category_summary(self):
         with self._get_connection() as conn:
-            transactions = pd.read_sql('SELECT * FROM transactions', conn)
-            if not transactions.empty:
-                return transactions[transactions['loai'] == 'Chi'].groupby('danh_muc')['so_tien'].sum().to_dict()
-            return {}
+            rows = conn.execute('''
+                SELECT danh_muc, so_tien FROM category_totals
+                WHERE loai = 'Chi'
+            ''').fetchall()
+            return dict(rows)
     
-    def set_budget(self, category, amount):
+    @cached_query
+    def get_daily_expenses(self):
         with self._get_connection() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO budgets (category, amount)
-                VALUES (?, ?)
-            ''', (category, amount))
-            conn.commit()
+            df = pd.read_sql('''
+                SELECT ngay, SUM(so_tien) AS so_tien FROM daily_totals
+                WHERE loai = 'Chi' AND ngay <> ''
+                GROUP BY ngay
+                ORDER BY ngay
+            ''', conn)
+        df['ngay'] = pd.to_datetime(df['ngay'], format='ISO8601', errors='coerce')
+        return df.dropna(subset=['ngay'])
+    
+    @cached_query
+    def get_period_summary(self, period='M'):
+        # period: 'M' (tháng), 'Q' (quý) hoặc 'Y' (năm)
+        period_expr = PERIOD_EXPRESSIONS[period]
+        with self._get_connection() as conn:
+            df = pd.read_sql(f'''
+                SELECT {period_expr} AS period, loai, SUM(so_tien) AS so_tien
+                FROM monthly_totals
+                WHERE thang <> ''
+                GROUP BY 1, 2
+            ''', conn)
+        if df.empty:
+            return pd.DataFrame()
+        return df.pivot(index='period', columns='loai', values='so_tien').fillna(0)
     
+    def set_budget(self, category, amount, period='monthly', wait=True):
+        # period: 'weekly', 'monthly' hoặc 'yearly' (xem scheduling.BUDGET_PERIODS)
+        if period not in BUDGET_PERIODS:
+            raise ValueError(f'Kỳ ngân sách không hợp lệ: {period}')
+        return self._write(lambda conn: conn.execute('''
+            INSERT OR REPLACE INTO budgets (category, amount, period)
+            VALUES (?, ?, ?)
+        ''', (category, amount, period)).rowcount, wait)
+    
+    @cached_query
     def get_budgets(self):
         with self._get_connection() as conn:
             budgets = conn.execute('SELECT category, amount FROM budgets').fetchall()
             return dict(budgets)
     
-    def add_reminder(self, name, due_date, amount, category):
+    @staticmethod
+    def _period_spending_sql(period, day):
+        # Câu SELECT tổng chi theo danh mục trong kỳ chứa ``day``, đọc từ bảng tổng hợp
+        table, column, width = BUDGET_SOURCES[period]
+        start, end = period_bounds(period, day)
+        sql = f'''
+            SELECT '{period}' AS period, danh_muc, SUM(so_tien) AS spent FROM {table}
+            WHERE loai = 'Chi' AND {column} BETWEEN ? AND ?
+            GROUP BY danh_muc
+        '''
+        return sql, [start.isoformat()[:width], end.isoformat()[:width]]
+    
+    def evaluate_budgets(self, today=None):
+        """Chi tiêu so với ngân sách của mọi danh mục trong kỳ hiện tại.
+
+        Một truy vấn gộp trên monthly_totals (tháng, năm) và daily_totals (tuần),
+        nên chi phí không phụ thuộc số giao dịch. Trả về DataFrame gồm category,
+        period, amount, spent, remaining, ratio, status ('ok', 'warning', 'over'),
+        period_start và period_end.
+        """
+        return self._evaluate_budgets(to_date(today or date.today()))
+    
+    @cached_query
+    def _evaluate_budgets(self, today):
+        parts, params = [], []
+        for period in BUDGET_PERIODS:
+            sql, period_params = self._period_spending_sql(period, today)
+            parts.append(sql)
+            params += period_params
         with self._get_connection() as conn:
-            conn.execute('''
-                INSERT INTO reminders (name, due_date, amount, category)
-                VALUES (?, ?, ?, ?)
-            ''', (name, due_date, amount, category))
-            conn.commit()
+            rows = conn.execute(f'''
+                SELECT b.category, b.period, b.amount, COALESCE(s.spent, 0)
+                FROM budgets b
+                LEFT JOIN ({' UNION ALL '.join(parts)}) s
+                    ON s.period = b.period AND s.danh_muc = b.category
+                ORDER BY b.category
+            ''', params).fetchall()
+        budgets = pd.DataFrame.from_records(rows, columns=['category', 'period', 'amount', 'spent'])
+        budgets['remaining'] = budgets['amount'] - budgets['spent']
+        budgets['ratio'] = (budgets['spent'] / budgets['amount'].where(budgets['amount'] > 0)).fillna(0.0)
+        budgets['status'] = pd.cut(budgets['ratio'], [-np.inf, *BUDGET_ALERT_THRESHOLDS, np.inf],
+                                   labels=['ok', 'warning', 'over']).astype(str)
+        bounds = {period: period_bounds(period, today) for period in BUDGET_PERIODS}
+        budgets['period_start'] = budgets['period'].map(lambda period: bounds[period][0].isoformat())
+        budgets['period_end'] = budgets['period'].map(lambda period: bounds[period][1].isoformat())
+        return budgets
     
+    def check_budget_alert(self, category, date, amount):
+        """Cảnh báo khi khoản chi ``amount`` vừa ghi làm danh mục vượt một ngưỡng ngân sách.
+
+        Chỉ đọc ngân sách của danh mục và tổng chi của đúng kỳ chứa ``date`` từ
+        bảng tổng hợp. Trả về dict (category, period, amount, spent, ratio,
+        threshold) của ngưỡng cao nhất vừa vượt, hoặc None.
+        """
+        with self._get_connection() as conn:
+            budget = conn.execute('SELECT amount, period FROM budgets WHERE category = ?',
+                                  (category,)).fetchone()
+            if budget is None or not budget[0]:
+                return None
+            budget_amount, period = budget
+            sql, params = self._period_spending_sql(period, date)
+            row = conn.execute(f'SELECT spent FROM ({sql}) WHERE danh_muc = ?',
+                               params + [category]).fetchone()
+        spent = row[0] if row else 0
+        crossed = [threshold for threshold in BUDGET_ALERT_THRESHOLDS
+                   if spent - amount <= threshold * budget_amount < spent]
+        if not crossed:
+            return None
+        return {'category': category, 'period': period, 'amount': budget_amount,
+                'spent': spent, 'ratio': spent / budget_amount, 'threshold': crossed[-1]}
+    
+    def add_reminder(self, name, due_date, amount, category, recurrence='none', wait=True):
+        # recurrence: 'none', 'weekly', 'monthly' hoặc 'yearly' (xem scheduling.RECURRENCES)
+        if recurrence not in RECURRENCES:
+            raise ValueError(f'Chu kỳ lặp không hợp lệ: {recurrence}')
+        due_date = to_date(due_date)
+        return self._write(lambda conn: conn.execute('''
+            INSERT INTO reminders (name, due_date, amount, category, due_day, recurrence)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, due_date.isoformat(), amount, category, due_date.toordinal(), recurrence)).lastrowid,
+            wait)
+    
+    @cached_query
     def get_reminders(self):
         with self._get_connection() as conn:
             try:
@@ -204,14 +1457,104 @@ class Database:
             except:
                 return pd.DataFrame(columns=['id', 'name', 'due_date', 'amount', 'category'])
     
-    def add_saving_goal(self, name, amount, target_date):
+    def _reminder_buckets(self, today, within_days):
+        # Khoảng due_day [từ, đến] của từng nhóm; None là không giới hạn
+        return {
+            'overdue': (None, today - 1),
+            'upcoming': (today, today + within_days),
+            'later': (today + within_days + 1, None),
+        }
+    
+    @cached_query
+    def _recurring_reminders(self):
         with self._get_connection() as conn:
-            conn.execute('''
-                INSERT INTO saving_goals (name, amount, target_date)
-                VALUES (?, ?, ?)
-            ''', (name, amount, target_date))
-            conn.commit()
+            return conn.execute(f'''
+                SELECT {', '.join(REMINDER_COLUMNS)} FROM reminders
+                WHERE recurrence != 'none'
+            ''').fetchall()
+    
+    def _recurring_occurrences(self, bucket, today, within_days):
+        # Các lần đến hạn của nhắc nhở lặp lại trong nhóm, sinh lười thay vì lưu sẵn.
+        # Nhắc nhở lặp lại không bao giờ quá hạn; nhóm 'later' chỉ lấy lần kế tiếp.
+        if bucket == 'overdue':
+            return []
+        start, end = self._reminder_buckets(today, within_days)[bucket]
+        rows = []
+        for row in self._recurring_reminders():
+            due_day = row[5]
+            if due_day is None:
+                continue
+            if bucket == 'later':
+                day = next_occurrence(due_day, row[6], start)
+                days = [day] if day is not None else []
+            else:
+                days = occurrences(due_day, row[6], start, end)
+            rows.extend((day,) + row[:5] + (row[6],) for day in days)
+        return rows
+    
+    def query_reminders(self, bucket, after=None, limit=20, today=None, within_days=7):
+        """Một trang nhắc nhở của nhóm 'overdue', 'upcoming' hoặc 'later', sắp theo ngày đến hạn.
+
+        Nhắc nhở một lần được lọc bằng index (due_day, id); nhắc nhở lặp lại
+        được mở rộng lười trong khoảng ngày của nhóm. ``after`` là con trỏ
+        (due_day, id) của dòng cuối trang trước. Trả về (DataFrame, con trỏ
+        trang sau hoặc None).
+        """
+        today = today_number() if today is None else day_number(today)
+        start, end = self._reminder_buckets(today, within_days)[bucket]
+        clauses, params = ["recurrence = 'none'", 'due_day IS NOT NULL'], []
+        if start is not None:
+            clauses.append('due_day >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('due_day <= ?')
+            params.append(end)
+        if after is not None:
+            clauses.append('(due_day, id) > (?, ?)')
+            params.extend(after)
+        with self._get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT due_day, id, name, due_date, amount, category, recurrence
+                FROM reminders WHERE {' AND '.join(clauses)}
+                ORDER BY due_day, id
+                LIMIT ?
+            ''', params + [limit + 1]).fetchall()
+        recurring = [row for row in self._recurring_occurrences(bucket, today, within_days)
+                     if after is None or (row[0], row[1]) > tuple(after)]
+        if recurring:
+            rows = sorted(rows + recurring, key=lambda row: (row[0], row[1]))[:limit + 1]
+        page = pd.DataFrame.from_records(
+            rows[:limit], columns=['due_day', 'id', 'name', 'due_date', 'amount', 'category', 'recurrence'])
+        # due_date là ngày của lần đến hạn (với nhắc nhở lặp lại là lần được mở rộng)
+        page['due_date'] = [from_day_number(day).isoformat() for day in page['due_day']]
+        page['days_left'] = page['due_day'] - today
+        next_cursor = (rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return page.drop(columns='due_day'), next_cursor
+    
+    def count_reminders(self, today=None, within_days=7):
+        # Số nhắc nhở mỗi nhóm; đếm bằng index nên không phụ thuộc tổng số nhắc nhở
+        today = today_number() if today is None else day_number(today)
+        return self._count_reminders(today, within_days)
     
+    @cached_query
+    def _count_reminders(self, today, within_days):
+        counts = {}
+        with self._get_connection() as conn:
+            for bucket, (start, end) in self._reminder_buckets(today, within_days).items():
+                counts[bucket] = conn.execute('''
+                    SELECT COUNT(*) FROM reminders
+                    WHERE recurrence = 'none' AND due_day BETWEEN ? AND ?
+                ''', (start if start is not None else -1, end if end is not None else 2 ** 62)).fetchone()[0]
+                counts[bucket] += len(self._recurring_occurrences(bucket, today, within_days))
+        return counts
+    
+    def add_saving_goal(self, name, amount, target_date, wait=True):
+        return self._write(lambda conn: conn.execute('''
+            INSERT INTO saving_goals (name, amount, target_date)
+            VALUES (?, ?, ?)
+        ''', (name, amount, target_date)).lastrowid, wait)
+    
+    @cached_query
     def get_saving_goals(self):
         with self._get_connection() as conn:
             try:
@@ -219,11 +1562,57 @@ class Database:
             except:
                 return pd.DataFrame(columns=['id', 'name', 'amount', 'target_date'])
     
+    def forecast_saving_goals(self, today=None, paths=FORECAST_PATHS, seed=0):
+        """Dự báo Monte Carlo khả năng và thời điểm đạt từng mục tiêu tiết kiệm.
+
+        Dòng tiền từng danh mục được ước lượng từ monthly_totals của
+        LOOKBACK_MONTHS tháng trọn vẹn gần nhất; ``paths`` đường được mô phỏng
+        một lần cho mọi mục tiêu (xem forecast.py). Seed cố định nên kết quả ổn
+        định giữa các lần chạy lại trang và được cache theo data_version.
+        """
+        return self._forecast_saving_goals(to_date(today or date.today()), paths, seed)
+    
+    @cached_query
+    def _forecast_saving_goals(self, today, paths, seed):
+        goals = self.get_saving_goals()
+        months = [month_key(today, -k) for k in range(LOOKBACK_MONTHS, 0, -1)]
+        with self._get_connection() as conn:
+            monthly = pd.read_sql('''
+                SELECT thang, loai, danh_muc, so_tien FROM monthly_totals
+                WHERE thang BETWEEN ? AND ? AND thang <> ''
+            ''', conn, params=[months[0], months[-1]])
+        if not monthly.empty:
+            # Sổ cái mới mở: chỉ tính từ tháng đầu tiên có giao dịch
+            months = [month for month in months if month >= monthly['thang'].min()]
+        days_in_month = calendar.monthrange(today.year, today.month)[1]
+        flows = simulate_cash_flows(fit_category_models(monthly, months), horizon_months(today, goals),
+                                    paths, (days_in_month - today.day + 1) / days_in_month, seed)
+        return forecast_goals(self.get_balance(), goals, flows, today)
+    
     def reset_data(self):
+        self.flush_writes()
         with self._get_connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Các trigger AFTER DELETE (tổng hợp, change log, FTS) được gỡ tạm trong giao dịch:
+            # bảng không có trigger thì SQLite xóa cả bảng một lần thay vì chạy trigger cho từng
+            # dòng, sau đó bảng tổng hợp, change log và chỉ mục FTS được dọn trực tiếp
+            triggers = conn.execute('''
+                SELECT name, sql FROM sqlite_master
+                WHERE type = 'trigger' AND tbl_name = 'transactions' AND sql LIKE '%AFTER DELETE%'
+            ''').fetchall()
+            for name, _ in triggers:
+                conn.execute(f'DROP TRIGGER {name}')
             conn.execute('DELETE FROM transactions')
+            for _, sql in triggers:
+                conn.execute(sql)
+            conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('delete-all')")
+            for table in AGGREGATE_TABLES:
+                conn.execute(f'DELETE FROM {table}')
             conn.execute('DELETE FROM balance')
             conn.execute('DELETE FROM budgets')
             conn.execute('DELETE FROM reminders')
             conn.execute('DELETE FROM saving_goals')
+            conn.execute('DELETE FROM recurring_rules')
+            self._reset_change_log(conn)
+            self._bump_version(conn)
             conn.commit()
\ No newline at end of file
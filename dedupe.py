@@ -0,0 +1,61 @@
+import hashlib
+import unicodedata
+from collections import Counter
+
+# Cách xử lý dòng trùng dấu vân tay với giao dịch đã có khi ghi:
+#   'allow'  ghi như thường (vẫn lưu dấu vân tay để quét trùng sau này)
+#   'skip'   bỏ các dòng database đã có đủ số bản, nhập lại cùng một file không thêm gì
+#   'reject' báo DuplicateTransactionError và không ghi dòng nào
+DUPLICATE_POLICIES = ('allow', 'skip', 'reject')
+
+
+class DuplicateTransactionError(ValueError):
+    def __init__(self, duplicates):
+        super().__init__(f'{len(duplicates)} giao dịch giống hệt đã có trong sổ')
+        self.duplicates = duplicates  # vị trí các dòng trùng trong lô
+
+
+def normalize_description(text):
+    # Mô tả không phân biệt hoa thường, khoảng trắng thừa và dạng Unicode
+    return ' '.join(unicodedata.normalize('NFC', text or '').casefold().split())
+
+
+def transaction_fingerprint(day, category_id, amount, description, reference=None):
+    """Dấu vân tay 64 bit (vừa kiểu INTEGER của SQLite) của một giao dịch đã mã hóa.
+
+    Gồm day number, category_id (đã hàm ý loại Thu/Chi), số tiền nguyên đồng,
+    mô tả đã chuẩn hóa và mã tham chiếu của ngân hàng nếu có.
+    """
+    key = '\x1f'.join([str(day), str(category_id), str(amount), normalize_description(description),
+                       reference or ''])
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+class Deduplicator:
+    """Chọn dòng cần ghi theo chính sách 'skip', có thể kéo dài qua nhiều lô.
+
+    Các bản giống nhau trong dữ liệu nhập là hợp lệ (hai ly cà phê cùng giá
+    trong ngày): bản thứ k của một fingerprint chỉ bị bỏ khi database đã có ít
+    nhất k bản từ trước lần nhập (id <= ``start_id``; None là mọi dòng đang có).
+    Dùng chung một Deduplicator cho mọi khối của một file thì bản trùng rơi vào
+    hai khối khác nhau vẫn được giữ. Chỉ nhớ số dòng đã bỏ, nên bộ nhớ tỉ lệ
+    với số dòng trùng chứ không với kích thước file.
+    """
+
+    def __init__(self, start_id=None):
+        self.start_id = start_id
+        self.skipped = Counter()
+
+    def mask(self, fingerprints, counts):
+        # counts: {fingerprint: (số bản có từ trước, số bản lần nhập này đã ghi)}
+        seen = Counter()
+        skipped_before = {fingerprint: self.skipped[fingerprint] for fingerprint in set(fingerprints)}
+        mask = []
+        for fingerprint in fingerprints:
+            seen[fingerprint] += 1
+            existing, written = counts.get(fingerprint, (0, 0))
+            keep = skipped_before[fingerprint] + written + seen[fingerprint] > existing
+            if not keep:
+                self.skipped[fingerprint] += 1
+            mask.append(keep)
+        return mask
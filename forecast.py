@@ -0,0 +1,140 @@
+import calendar
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Số đường Monte Carlo, số tháng lịch sử dùng để ước lượng và giới hạn tầm dự báo
+FORECAST_PATHS = 2000
+LOOKBACK_MONTHS = 12
+MAX_HORIZON_MONTHS = 120
+# Dự báo thêm chừng này tháng sau hạn của mục tiêu xa nhất để ước lượng ngày đạt khi trễ hạn
+EXTRA_HORIZON_MONTHS = 24
+FORECAST_COLUMNS = ['id', 'name', 'amount', 'target_date', 'required', 'funded', 'probability',
+                    'probability_ever', 'expected_date', 'optimistic_date', 'pessimistic_date']
+
+
+def month_key(value, offset=0):
+    # 'YYYY-MM' của tháng cách tháng chứa value ``offset`` tháng (cùng định dạng cột thang)
+    index = value.year * 12 + value.month - 1 + offset
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def fit_category_models(monthly, months):
+    """Ước lượng dòng tiền hàng tháng của từng danh mục từ lịch sử.
+
+    monthly: DataFrame (thang, loai, danh_muc, so_tien) của các tháng trong
+    ``months``. Mỗi danh mục là biến ngẫu nhiên: có phát sinh trong tháng với
+    xác suất ``p`` (tỉ lệ tháng có giao dịch), khi phát sinh thì tổng tháng
+    theo phân phối log-normal (mu, sigma) của các tháng có giao dịch. Trả về
+    dict các mảng sign (+1 thu, -1 chi), p, mu, sigma và danh sách nhãn.
+    """
+    if monthly.empty or not months:
+        empty = np.zeros(0)
+        return {'labels': [], 'sign': empty, 'p': empty, 'mu': empty, 'sigma': empty}
+    table = (monthly.pivot_table(index='thang', columns=['loai', 'danh_muc'], values='so_tien',
+                                 aggfunc='sum')
+             .reindex(months).fillna(0.0))
+    values = table.to_numpy(dtype=float)
+    active = values > 0
+    logs = np.log(np.where(active, values, 1.0))
+    counts = active.sum(axis=0)
+    mu = np.where(counts > 0, (logs * active).sum(axis=0) / np.maximum(counts, 1), 0.0)
+    variance = ((logs - mu) ** 2 * active).sum(axis=0) / np.maximum(counts - 1, 1)
+    return {
+        'labels': list(table.columns),
+        'sign': np.array([1.0 if loai == 'Thu' else -1.0 for loai, _ in table.columns]),
+        'p': counts / len(months),
+        'mu': mu,
+        'sigma': np.sqrt(variance),
+    }
+
+
+def simulate_cash_flows(models, horizon, paths=FORECAST_PATHS, first_fraction=1.0, seed=0):
+    """Mô phỏng dòng tiền ròng hàng tháng: mảng (paths, horizon).
+
+    Mỗi tháng sinh mọi đường và danh mục trong một lần tính trên mảng
+    (paths, danh mục) rồi cộng vào cột của tháng đó, nên bộ nhớ đỉnh là
+    O(paths x horizon) thay vì O(paths x horizon x danh mục). Tháng đầu chỉ
+    tính phần còn lại ``first_fraction`` vì phần đã qua đã nằm trong số dư
+    hiện tại.
+    """
+    rng = np.random.default_rng(seed)
+    n_categories = len(models['sign'])
+    flows = np.zeros((paths, horizon))
+    if n_categories == 0:
+        return flows
+    shape = (paths, n_categories)
+    for month in range(horizon):
+        occurs = rng.random(shape) < models['p']
+        amounts = np.exp(models['mu'] + models['sigma'] * rng.standard_normal(shape))
+        flows[:, month] = (occurs * amounts) @ models['sign']
+    flows[:, :1] *= first_fraction
+    return flows
+
+
+def forecast_goals(balance, goals, flows, today):
+    """Xác suất và ngày dự kiến đạt từng mục tiêu trên các đường dòng tiền.
+
+    Mục tiêu được góp lần lượt theo hạn (hạn sớm trước): mục tiêu thứ i đạt khi
+    số dư vượt tổng số tiền của các mục tiêu tới i (cột ``required``), thay vì
+    mọi mục tiêu cùng so với một số dư. Ngày đạt được nội suy tuyến tính trong
+    tháng. Trả về DataFrame theo FORECAST_COLUMNS.
+    """
+    if goals.empty:
+        return pd.DataFrame(columns=FORECAST_COLUMNS)
+    goals = goals.assign(target=pd.to_datetime(goals['target_date'], errors='coerce'))
+    goals = goals.sort_values(['target', 'id'], na_position='last').reset_index(drop=True)
+    required = goals['amount'].fillna(0).astype(float).cumsum().to_numpy()
+    paths, horizon = flows.shape
+
+    # Ranh giới các bước: bước 0 từ hôm nay tới cuối tháng, sau đó mỗi bước một tháng
+    today_day = today.toordinal()
+    step_ends = np.array([_month_end(today, k).toordinal() + 1 for k in range(horizon)])
+    step_starts = np.concatenate([[today_day], step_ends[:-1]])
+    balances = balance + np.concatenate([np.zeros((paths, 1)), np.cumsum(flows, axis=1)], axis=1)
+
+    # reached[p, k, g]: cuối bước k đường p đủ tiền cho mục tiêu g
+    reached = balances[:, 1:, None] >= required
+    ever = reached.any(axis=1)
+    step = reached.argmax(axis=1)
+    before = np.take_along_axis(balances[:, :-1], step, axis=1)
+    after = np.take_along_axis(balances[:, 1:], step, axis=1)
+    fraction = np.clip((required - before) / np.where(after > before, after - before, 1.0), 0.0, 1.0)
+    days = step_starts[step] + fraction * (step_ends[step] - step_starts[step])
+    already = balance >= required
+    days = np.where(already, today_day, np.where(ever, days, np.nan))
+
+    target_days = np.array([t.toordinal() if not pd.isna(t) else np.nan for t in goals['target']])
+    on_time = np.where(np.isnan(target_days), ~np.isnan(days), days <= target_days)
+
+    result = goals[['id', 'name', 'amount', 'target_date']].copy()
+    result['required'] = required
+    # Phần số dư hiện tại đã dành cho mục tiêu sau khi trừ các mục tiêu hạn sớm hơn
+    result['funded'] = np.clip(balance - (required - goals['amount'].fillna(0).to_numpy()),
+                               0, goals['amount'].fillna(0).to_numpy())
+    result['probability'] = np.where(already, 1.0, on_time.mean(axis=0))
+    result['probability_ever'] = np.where(already, 1.0, (~np.isnan(days)).mean(axis=0))
+    # Ngày đạt ở phân vị 10/50/90 trong các đường đạt được mục tiêu
+    quantiles = [np.percentile(column[~np.isnan(column)], [10, 50, 90]) if (~np.isnan(column)).any()
+                 else [np.nan] * 3 for column in days.T]
+    for i, column in enumerate(['optimistic_date', 'expected_date', 'pessimistic_date']):
+        result[column] = [_day_to_date(q[i]) for q in quantiles]
+    return result[FORECAST_COLUMNS]
+
+
+def _month_end(value, offset):
+    year, month = divmod(value.year * 12 + value.month - 1 + offset, 12)
+    return date(year, month + 1, calendar.monthrange(year, month + 1)[1])
+
+
+def _day_to_date(day):
+    return None if np.isnan(day) else date.fromordinal(int(day))
+
+
+def horizon_months(today, goals):
+    # Số tháng cần dự báo để phủ hạn xa nhất cộng thêm EXTRA_HORIZON_MONTHS
+    targets = pd.to_datetime(goals['target_date'], errors='coerce').dropna()
+    last = max(targets).date() if len(targets) else today
+    months = (last.year - today.year) * 12 + last.month - today.month + 1 + EXTRA_HORIZON_MONTHS
+    return int(min(max(months, 1), MAX_HORIZON_MONTHS))
@@ -0,0 +1,239 @@
+import bisect
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from cache import data_cache, estimate_size, figure_cache
+
+# Biên (ms) của các ô histogram độ trễ; ô cuối chứa mọi giá trị lớn hơn
+LATENCY_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000]
+RECENT_SAMPLES = 512
+SLOW_QUERY_MS = 100
+MAX_SLOW_ENTRIES = 200
+# Progress handler của SQLite được gọi sau mỗi ngần này lệnh VM; số lần gọi
+# xấp xỉ khối lượng dòng mà câu lệnh phải quét
+VM_STEP_GRANULARITY = 1000
+
+
+def _result_size(result):
+    # Số dòng và số byte của giá trị trả về (DataFrame, dict, list, tuple)
+    if result is None:
+        return 0, 0
+    if hasattr(result, 'memory_usage') or isinstance(result, (dict, list, tuple)):
+        if isinstance(result, tuple) and result and hasattr(result[0], 'memory_usage'):
+            result = result[0]  # (DataFrame, con trỏ) của query_transactions
+        return len(result), estimate_size(result)
+    return 1, estimate_size(result)
+
+
+class Metrics:
+    """Bộ đếm số lần gọi, histogram độ trễ, số dòng và số byte trả về theo tên."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed_ms, rows=0, nbytes=0, error=False):
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = {
+                    'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'rows': 0, 'bytes': 0,
+                    'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                    'recent': deque(maxlen=RECENT_SAMPLES),
+                }
+            stat['count'] += 1
+            stat['errors'] += int(error)
+            stat['total_ms'] += elapsed_ms
+            stat['max_ms'] = max(stat['max_ms'], elapsed_ms)
+            stat['rows'] += rows
+            stat['bytes'] += nbytes
+            stat['histogram'][bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+            stat['recent'].append(elapsed_ms)
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000, error=error)
+
+    def start(self, name):
+        # Dùng cho các đoạn script không bọc được trong khối with (ví dụ trang của app.py)
+        started = time.perf_counter()
+        return lambda: self.record(name, (time.perf_counter() - started) * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            stats = {name: dict(stat, recent=list(stat['recent'])) for name, stat in self._stats.items()}
+        report = {}
+        for name, stat in sorted(stats.items()):
+            recent = sorted(stat.pop('recent'))
+            stat['mean_ms'] = stat['total_ms'] / stat['count']
+            stat['p50_ms'] = recent[len(recent) // 2] if recent else 0.0
+            stat['p95_ms'] = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+            report[name] = stat
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class QueryLog:
+    """Ghi lại câu SQL của các lời gọi chậm kèm EXPLAIN QUERY PLAN (tắt mặc định)."""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.enabled = False
+        self.slow_ms = slow_ms
+        self.entries = deque(maxlen=MAX_SLOW_ENTRIES)
+        self._local = threading.local()
+
+    def attach(self, conn):
+        # Chỉ gắn khi log bật: trace callback và progress handler làm chậm lệnh quét lớn 5-10%
+        conn.set_trace_callback(self.trace)
+        conn.set_progress_handler(self.progress, VM_STEP_GRANULARITY)
+
+    def detach(self, conn):
+        conn.set_trace_callback(None)
+        conn.set_progress_handler(None, 0)
+
+    def trace(self, sql):
+        # Được gắn vào mỗi kết nối bằng set_trace_callback
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            stack[-1].append(sql)
+
+    def progress(self):
+        if getattr(self._local, 'stack', None):
+            self._local.steps += VM_STEP_GRANULARITY
+        return 0
+
+    @contextmanager
+    def capture(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        if not stack:
+            self._local.steps = 0
+        statements = []
+        stack.append(statements)
+        try:
+            yield statements
+        finally:
+            stack.pop()
+            if stack:
+                stack[-1].extend(statements)
+
+    def steps(self):
+        return getattr(self._local, 'steps', 0)
+
+    def add(self, name, elapsed_ms, statements, explain=None, vm_steps=0):
+        entry = {'name': name, 'ms': elapsed_ms, 'at': time.time(), 'vm_steps': vm_steps,
+                 'statements': []}
+        for sql in statements:
+            plan = None
+            if explain is not None and sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                try:
+                    plan = explain(sql)
+                except Exception as e:
+                    plan = [f'EXPLAIN lỗi: {e}']
+            entry['statements'].append({'sql': sql, 'plan': plan})
+        self.entries.append(entry)
+
+    def snapshot(self):
+        return list(self.entries)
+
+
+metrics = Metrics()
+query_log = QueryLog()
+
+
+def instrumented(name, explain=None):
+    """Decorator ghi độ trễ, số dòng/byte trả về; ghi SQL khi query log bật và lời gọi chậm.
+
+    explain(self, sql) (tùy chọn) trả về EXPLAIN QUERY PLAN cho câu SQL chậm.
+    Hàm generator được đo trên toàn bộ quá trình lặp.
+    """
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                rows = nbytes = 0
+                error = False
+                try:
+                    for item in fn(*args, **kwargs):
+                        item_rows, item_bytes = _result_size(item)
+                        rows += item_rows
+                        nbytes += item_bytes
+                        yield item
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    metrics.record(name, (time.perf_counter() - started) * 1000, rows, nbytes, error)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            logging = query_log.enabled
+            started = time.perf_counter()
+            result = None
+            error = False
+            with (query_log.capture() if logging else _no_capture()) as statements:
+                steps_before = query_log.steps()
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    rows, nbytes = _result_size(result)
+                    metrics.record(name, elapsed_ms, rows, nbytes, error)
+            if logging and statements and elapsed_ms >= query_log.slow_ms:
+                bound_explain = functools.partial(explain, args[0]) if explain and args else None
+                query_log.add(name, elapsed_ms, statements, bound_explain,
+                              query_log.steps() - steps_before)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def _no_capture():
+    yield None
+
+
+def instrument_methods(prefix, explain=None):
+    """Decorator lớp: gắn ``instrumented`` cho mọi phương thức public."""
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('_') or not inspect.isfunction(value):
+                continue
+            setattr(cls, attr, instrumented(f'{prefix}.{attr}', explain)(value))
+        return cls
+    return decorator
+
+
+def dump(indent=2):
+    # Bản dump dạng JSON cho công cụ bên ngoài
+    return json.dumps({
+        'metrics': metrics.snapshot(),
+        'slow_queries': query_log.snapshot(),
+        'cache': data_cache.stats(),
+        'figure_cache': figure_cache.stats(),
+        'query_log_enabled': query_log.enabled,
+        'slow_ms': query_log.slow_ms,
+    }, indent=indent, ensure_ascii=False, default=str)
@@ -0,0 +1,148 @@
+# Kiểm thử tải cho api.py: nhiều client đồng thời, mỗi client một kết nối keep-alive.
+#
+#   python loadtest.py --clients 200 --requests 50 --rows 100000
+#   python loadtest.py --url http://127.0.0.1:8080 --clients 500 --write-ratio 0.2
+#
+# Không có --url: sinh sổ cái tổng hợp (benchmark.generate_ledger) vào file tạm
+# và chạy api.py trong tiến trình con. Client nhớ ETag của từng đường dẫn và gửi
+# If-None-Match như một ứng dụng di động thật.
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from benchmark import generate_ledger, percentile
+from database import Database
+
+READ_PATHS = ['/balance', '/transactions', '/transactions?loai=Chi&limit=20', '/transactions?q=c%C3%A0%20ph%C3%AA',
+              '/categories', '/summary?period=M', '/budgets', '/reminders', '/goals']
+
+
+async def _request(reader, writer, method, path, headers=None, body=b''):
+    lines = [f'{method} {path} HTTP/1.1', 'Host: localhost', f'Content-Length: {len(body)}']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split(' ')[1])
+    response_headers = {}
+    for line in head[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            response_headers[name.strip().lower()] = value.strip()
+    length = int(response_headers.get('content-length') or 0)
+    payload = await reader.readexactly(length) if length else b''
+    return status, response_headers, payload
+
+
+async def client(host, port, requests, write_ratio, rng, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    etags = {}
+    try:
+        for _ in range(requests):
+            if rng.random() < write_ratio:
+                record = {'ngay': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}', 'loai': 'Chi',
+                          'danh_muc': 'Ăn uống', 'so_tien': rng.randint(5, 500) * 1000, 'mo_ta': 'tải thử'}
+                method, path, headers, body = 'POST', '/transactions', {}, json.dumps(record).encode('utf-8')
+            else:
+                path = rng.choice(READ_PATHS)
+                method, body = 'GET', b''
+                headers = {'If-None-Match': etags[path]} if path in etags else {}
+            started = time.perf_counter()
+            status, response_headers, _ = await _request(reader, writer, method, path, headers, body)
+            latencies[method].append((time.perf_counter() - started) * 1000)
+            statuses[status] += 1
+            if 'etag' in response_headers:
+                etags[path] = response_headers['etag']
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, clients, requests, write_ratio, seed=42):
+    latencies = {'GET': [], 'POST': []}
+    statuses = Counter()
+    started = time.perf_counter()
+    await asyncio.gather(*(client(host, port, requests, write_ratio, random.Random(seed + i),
+                                  latencies, statuses) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    total = sum(statuses.values())
+    report = {'clients': clients, 'requests': total, 'seconds': elapsed, 'rps': total / elapsed,
+              'statuses': dict(statuses)}
+    for method, samples in latencies.items():
+        if samples:
+            report[method] = {'count': len(samples), 'p50_ms': percentile(samples, 50),
+                              'p95_ms': percentile(samples, 95), 'p99_ms': percentile(samples, 99)}
+    return report
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f'api.py không mở cổng {port}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Kiểm thử tải api.py với nhiều client đồng thời')
+    parser.add_argument('--url', help='API đang chạy; bỏ trống để tự chạy api.py với dữ liệu tổng hợp')
+    parser.add_argument('--rows', type=int, default=100000, help='Số giao dịch tổng hợp khi tự chạy api.py')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=50, help='Số yêu cầu của mỗi client')
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--json', help='Ghi kết quả ra file JSON')
+    args = parser.parse_args(argv)
+
+    server = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            db_path = os.path.join(tmp, 'loadtest.db')
+            db = Database(db_path)
+            generate_ledger(db, args.rows)
+            db.close()
+            host, port = '127.0.0.1', _free_port()
+            server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api.py'),
+                                       '--db', db_path, '--port', str(port), '--workers', str(args.workers)])
+            _wait_for_port(port)
+        try:
+            report = asyncio.run(run_load(host, port, args.clients, args.requests, args.write_ratio))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    print(f"{report['requests']} yêu cầu từ {report['clients']} client trong {report['seconds']:.2f}s "
+          f"({report['rps']:.0f} req/s), mã trạng thái {report['statuses']}")
+    for method in ('GET', 'POST'):
+        if method in report:
+            stat = report[method]
+            print(f"{method:<5} {stat['count']:>7}  p50 {stat['p50_ms']:>8.2f}ms  "
+                  f"p95 {stat['p95_ms']:>8.2f}ms  p99 {stat['p99_ms']:>8.2f}ms")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
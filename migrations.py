@@ -0,0 +1,441 @@
+from datetime import datetime
+
+from dedupe import transaction_fingerprint
+from instrumentation import metrics
+
+# Số dòng chép mỗi giao dịch khi chuyển dữ liệu trực tuyến; giữa các khối
+# khóa ghi được nhả để phiên khác vẫn ghi được
+BACKFILL_BATCH_SIZE = 50000
+# Change log chỉ giữ chừng này mục sửa/xóa gần nhất, dọn mỗi CHANGE_LOG_TRIM_EVERY mục.
+# Giá trị được ghi vào trigger lúc tạo: đổi ở đây cần một migration mới.
+CHANGE_LOG_KEEP = 10000
+CHANGE_LOG_TRIM_EVERY = 1000
+
+# (version, tên, online, hàm(db, conn)) theo thứ tự áp dụng
+MIGRATIONS = []
+
+
+def migration(version, name, online=False, vacuum=False):
+    """Đăng ký một migration.
+
+    Migration thường chạy trong một giao dịch BEGIN IMMEDIATE cùng lệnh ghi
+    phiên bản. Migration ``online`` tự quản lý giao dịch (chép theo khối) và
+    phải chạy lại được nếu bị dừng giữa chừng. ``vacuum``: chạy VACUUM sau khi
+    xong để thu hồi dung lượng của bảng cũ.
+    """
+    def register(fn):
+        MIGRATIONS.append((version, name, online, vacuum, fn))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return fn
+    return register
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def schema_version(conn):
+    row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+    return row[0] or 0
+
+
+def migrate(db, conn):
+    # Áp dụng các migration chưa chạy; trả về danh sách version vừa áp dụng
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        ) STRICT
+    ''')
+    conn.commit()
+    applied = {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+    done = []
+    needs_vacuum = False
+    for version, name, online, vacuum, fn in MIGRATIONS:
+        if version in applied:
+            continue
+        with metrics.timed(f'migration.{version:03d}_{name}'):
+            if online:
+                fn(db, conn)
+            conn.execute('BEGIN IMMEDIATE')
+            # Tiến trình khác có thể đã áp dụng trong lúc chờ khóa
+            if conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                conn.rollback()
+                continue
+            try:
+                if not online:
+                    fn(db, conn)
+                conn.execute('INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)',
+                             (version, name, datetime.now().isoformat(timespec='seconds')))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        done.append(version)
+        needs_vacuum = needs_vacuum or vacuum
+    if needs_vacuum:
+        conn.execute('VACUUM')
+    return done
+
+
+# --- Các migration ---
+
+@migration(1, 'base_schema')
+def base_schema(db, conn):
+    # Lược đồ ban đầu; CREATE IF NOT EXISTS để nhận cả database có trước khung migration
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ngay TEXT,
+            loai TEXT,
+            danh_muc TEXT,
+            so_tien REAL,
+            mo_ta TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for key in ('data_version', 'transactions_epoch', 'aggregates_deferred'):
+        conn.execute('INSERT OR IGNORE INTO meta (key, value) VALUES (?, 0)', (key,))
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS balance (
+            id INTEGER PRIMARY KEY DEFAULT 1,
+            amount REAL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS budgets (
+            category TEXT PRIMARY KEY,
+            amount REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            due_date TEXT,
+            amount REAL,
+            category TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS saving_goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            amount REAL,
+            target_date TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT,
+            name TEXT,
+            UNIQUE(type, name)
+        )
+    ''')
+    # Nhật ký sửa/xóa giao dịch cho TransactionLoader
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transaction_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            transaction_id INTEGER NOT NULL
+        )
+    ''')
+
+
+@migration(2, 'reminder_schedule')
+def reminder_schedule(db, conn):
+    # due_day là ngày đến hạn dạng số (scheduling.day_number)
+    columns = table_columns(conn, 'reminders')
+    if 'due_day' not in columns:
+        conn.execute('ALTER TABLE reminders ADD COLUMN due_day INTEGER')
+    if 'recurrence' not in columns:
+        conn.execute("ALTER TABLE reminders ADD COLUMN recurrence TEXT NOT NULL DEFAULT 'none'")
+    conn.execute('''
+        UPDATE reminders SET due_day = CAST(julianday(due_date) - 1721424.5 AS INTEGER)
+        WHERE due_day IS NULL AND julianday(due_date) IS NOT NULL
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (due_day, id)')
+    # Nhắc nhở lặp lại được mở rộng trong Python nên chỉ cần tìm nhanh tập nhỏ này
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_recurring
+        ON reminders (id) WHERE recurrence != 'none'
+    ''')
+
+
+@migration(3, 'recurring_rules')
+def recurring_rules(db, conn):
+    # next_day là lần phát sinh kế tiếp chưa được ghi (NULL khi quy tắc đã kết thúc)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            loai TEXT NOT NULL,
+            danh_muc TEXT NOT NULL,
+            so_tien REAL NOT NULL,
+            mo_ta TEXT,
+            frequency TEXT NOT NULL,
+            interval INTEGER NOT NULL DEFAULT 1,
+            day_of_month INTEGER,
+            start_day INTEGER NOT NULL,
+            end_day INTEGER,
+            next_day INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recurring_rules_next ON recurring_rules (next_day)')
+
+
+@migration(4, 'budget_periods')
+def budget_periods(db, conn):
+    if 'period' not in table_columns(conn, 'budgets'):
+        conn.execute("ALTER TABLE budgets ADD COLUMN period TEXT NOT NULL DEFAULT 'monthly'")
+
+
+# Chuyển một dòng giao dịch cũ (ngay TEXT, loai/danh_muc TEXT, so_tien REAL) sang dạng gọn
+_LEGACY_TYPE = "CASE t.loai WHEN 'Thu' THEN 'income' WHEN 'Chi' THEN 'expense' ELSE COALESCE(t.loai, '') END"
+_LEGACY_NAME = "COALESCE(t.danh_muc, '')"
+# julianday() chấp nhận ngày không tồn tại ('2025-02-30' thành 2/3); ngày không đi
+# vòng được như vậy thành NULL, giống khi ghi mới (scheduling.day_number báo lỗi)
+_LEGACY_DAY = ("CASE WHEN date(julianday(t.ngay)) = substr(t.ngay, 1, 10) "
+               "THEN CAST(julianday(t.ngay) - 1721424.5 AS INTEGER) END")
+
+
+def _copy_legacy_transactions(conn, where, params):
+    # Đảm bảo mọi cặp (loại, danh mục) có trong categories rồi chép các dòng sang bảng mới
+    recurring = 't.recurring_id' if 'recurring_id' in table_columns(conn, 'transactions') else 'NULL'
+    conn.execute(f'''
+        INSERT OR IGNORE INTO categories (type, name)
+        SELECT DISTINCT {_LEGACY_TYPE}, {_LEGACY_NAME} FROM transactions t {where}
+    ''', params)
+    return conn.execute(f'''
+        INSERT OR REPLACE INTO transactions_compact (id, ngay, category_id, so_tien, mo_ta, recurring_id)
+        SELECT t.id, {_LEGACY_DAY}, c.id,
+               CAST(ROUND(COALESCE(t.so_tien, 0)) AS INTEGER), t.mo_ta, {recurring}
+        FROM transactions t
+        JOIN categories c ON c.type = {_LEGACY_TYPE} AND c.name = {_LEGACY_NAME}
+        {where}
+    ''', params).rowcount
+
+
+@migration(5, 'compact_transactions', online=True, vacuum=True)
+def compact_transactions(db, conn):
+    """Chuyển transactions sang bảng STRICT: ngày là số nguyên (day number),
+    số tiền là số nguyên đồng (VND có số chữ số lẻ ISO 4217 bằng 0) và danh mục
+    là khóa ngoại tới categories thay cho hai cột chuỗi lặp lại.
+
+    Dữ liệu được chép theo khối BACKFILL_BATCH_SIZE dòng, mỗi khối một giao
+    dịch; bước cuối chép phần còn lại, áp lại các dòng bị sửa/xóa trong lúc
+    chép (theo transaction_changes) rồi đổi bảng trong một giao dịch.
+    """
+    if 'category_id' in table_columns(conn, 'transactions'):
+        return  # Tiến trình khác đã chuyển xong
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions_compact (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ngay INTEGER,
+            category_id INTEGER NOT NULL REFERENCES categories (id),
+            so_tien INTEGER NOT NULL DEFAULT 0,
+            mo_ta TEXT,
+            recurring_id INTEGER
+        ) STRICT
+    ''')
+    # Vị trí change log lúc bắt đầu chép, giữ lại nếu migration được chạy tiếp sau khi dừng
+    conn.execute('''
+        INSERT OR IGNORE INTO meta (key, value)
+        SELECT 'migration_compact_seq', COALESCE(MAX(seq), 0) FROM transaction_changes
+    ''')
+    conn.commit()
+
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        if 'category_id' in table_columns(conn, 'transactions'):
+            conn.rollback()
+            return
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions_compact').fetchone()[0]
+        upper = conn.execute('SELECT id FROM transactions WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?',
+                             (last_id, BACKFILL_BATCH_SIZE - 1)).fetchone()
+        if upper is None:
+            conn.rollback()
+            break
+        _copy_legacy_transactions(conn, 'WHERE t.id > ? AND t.id <= ?', (last_id, upper[0]))
+        conn.commit()
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if 'category_id' in table_columns(conn, 'transactions'):
+            conn.rollback()
+            return
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions_compact').fetchone()[0]
+        _copy_legacy_transactions(conn, 'WHERE t.id > ?', (last_id,))
+        start_seq = conn.execute(
+            "SELECT value FROM meta WHERE key = 'migration_compact_seq'").fetchone()[0]
+        changed = 'SELECT transaction_id FROM transaction_changes WHERE seq > ?'
+        conn.execute(f'DELETE FROM transactions_compact WHERE id IN ({changed})', (start_seq,))
+        _copy_legacy_transactions(conn, f'WHERE t.id IN ({changed})', (start_seq,))
+
+        sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'transactions'").fetchone()
+        conn.execute('DROP TABLE transactions')
+        conn.execute('ALTER TABLE transactions_compact RENAME TO transactions')
+        if sequence is not None:
+            # Giữ bộ đếm AUTOINCREMENT để id đã xóa không bị dùng lại
+            conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'transactions'",
+                         (sequence[0],))
+
+        # Keyset phân trang theo (ngay, id) và lọc theo danh mục
+        conn.execute('CREATE INDEX idx_transactions_ngay ON transactions (ngay)')
+        conn.execute('CREATE INDEX idx_transactions_category_ngay ON transactions (category_id, ngay)')
+        # Mỗi quy tắc định kỳ sinh tối đa một giao dịch mỗi ngày
+        conn.execute('''
+            CREATE UNIQUE INDEX idx_transactions_recurring
+            ON transactions (recurring_id, ngay) WHERE recurring_id IS NOT NULL
+        ''')
+        conn.execute('''
+            CREATE TRIGGER trg_transactions_log_update
+            AFTER UPDATE ON transactions BEGIN
+                INSERT INTO transaction_changes (transaction_id) VALUES (OLD.id);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER trg_transactions_log_delete
+            AFTER DELETE ON transactions BEGIN
+                INSERT INTO transaction_changes (transaction_id) VALUES (OLD.id);
+            END
+        ''')
+        conn.execute("DELETE FROM meta WHERE key = 'migration_compact_seq'")
+        # Mọi loader nạp lại từ đầu, mọi cache bị bỏ
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key IN ('transactions_epoch', 'data_version')")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+@migration(6, 'strict_meta')
+def strict_meta(db, conn):
+    conn.execute('''
+        CREATE TABLE meta_strict (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) STRICT, WITHOUT ROWID
+    ''')
+    conn.execute('INSERT INTO meta_strict (key, value) SELECT key, value FROM meta')
+    conn.execute('DROP TABLE meta')
+    conn.execute('ALTER TABLE meta_strict RENAME TO meta')
+
+
+@migration(7, 'strict_aggregates')
+def strict_aggregates(db, conn):
+    # Bảng tổng hợp là dữ liệu suy ra: tạo lại dạng STRICT, số tiền nguyên, rồi tính lại
+    db._create_aggregate_tables(conn, replace=True)
+    db._rebuild_aggregates(conn)
+
+
+# Văn bản đưa vào chỉ mục tìm kiếm: tokenizer unicode61 bỏ dấu thanh và dấu mũ
+# (remove_diacritics 2) nhưng coi 'đ' là chữ riêng, nên đổi 'đ' -> 'd' trước khi đánh chỉ mục
+SEARCH_TEXT_SQL = "replace(replace({v}, 'đ', 'd'), 'Đ', 'D')"
+
+
+@migration(8, 'transaction_search')
+def transaction_search(db, conn):
+    # Bảng FTS5 không lưu nội dung (content=''): chỉ giữ chỉ mục, rowid = transactions.id
+    conn.execute('''
+        CREATE VIRTUAL TABLE transactions_fts USING fts5(
+            mo_ta, content='', tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    new_text = SEARCH_TEXT_SQL.format(v='NEW.mo_ta')
+    old_text = SEARCH_TEXT_SQL.format(v='OLD.mo_ta')
+    # Bảng contentless xóa bằng lệnh 'delete' kèm đúng văn bản đã đánh chỉ mục
+    conn.execute(f'''
+        CREATE TRIGGER trg_transactions_fts_insert
+        AFTER INSERT ON transactions WHEN NEW.mo_ta IS NOT NULL BEGIN
+            INSERT INTO transactions_fts (rowid, mo_ta) VALUES (NEW.id, {new_text});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER trg_transactions_fts_delete
+        AFTER DELETE ON transactions WHEN OLD.mo_ta IS NOT NULL BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, mo_ta) VALUES ('delete', OLD.id, {old_text});
+        END
+    ''')
+    # Một trigger cho UPDATE để chắc chắn xóa văn bản cũ trước khi thêm văn bản mới
+    conn.execute(f'''
+        CREATE TRIGGER trg_transactions_fts_update
+        AFTER UPDATE OF mo_ta ON transactions BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, mo_ta)
+            SELECT 'delete', OLD.id, {old_text} WHERE OLD.mo_ta IS NOT NULL;
+            INSERT INTO transactions_fts (rowid, mo_ta)
+            SELECT NEW.id, {new_text} WHERE NEW.mo_ta IS NOT NULL;
+        END
+    ''')
+    conn.execute(f'''
+        INSERT INTO transactions_fts (rowid, mo_ta)
+        SELECT id, {SEARCH_TEXT_SQL.format(v='mo_ta')} FROM transactions WHERE mo_ta IS NOT NULL
+    ''')
+    # Gộp các segment sau khi nạp lần đầu để truy vấn đọc ít b-tree hơn
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+
+
+@migration(9, 'transaction_fingerprints', online=True)
+def transaction_fingerprints(db, conn):
+    """Thêm cột fingerprint (dấu vân tay nội dung, xem dedupe.py) và tính cho dòng cũ.
+
+    Dòng cũ được tính theo khối BACKFILL_BATCH_SIZE, mỗi khối một giao dịch;
+    dòng ghi trong lúc đó đã có fingerprint nên chỉ cần quét các dòng NULL.
+    Index được tạo sau cùng để không phải cập nhật nó trong lúc tính.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    if 'fingerprint' not in table_columns(conn, 'transactions'):
+        conn.execute('ALTER TABLE transactions ADD COLUMN fingerprint INTEGER')
+        # Đổi fingerprint không làm thay đổi dòng mà loader đã nạp, không cần ghi change log
+        conn.execute('DROP TRIGGER IF EXISTS trg_transactions_log_update')
+        conn.execute('''
+            CREATE TRIGGER trg_transactions_log_update
+            AFTER UPDATE OF ngay, category_id, so_tien, mo_ta, recurring_id ON transactions BEGIN
+                INSERT INTO transaction_changes (transaction_id) VALUES (OLD.id);
+            END
+        ''')
+    conn.commit()
+
+    last_id = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        rows = conn.execute('''
+            SELECT id, ngay, category_id, so_tien, mo_ta FROM transactions
+            WHERE id > ? AND fingerprint IS NULL
+            ORDER BY id LIMIT ?
+        ''', (last_id, BACKFILL_BATCH_SIZE)).fetchall()
+        if not rows:
+            conn.rollback()
+            break
+        conn.executemany('UPDATE transactions SET fingerprint = ? WHERE id = ?',
+                         [(transaction_fingerprint(*row[1:]), row[0]) for row in rows])
+        conn.commit()
+        last_id = rows[-1][0]
+    # Kiểm tra trùng O(1) khi ghi và quét trùng một lượt theo thứ tự index
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_fingerprint ON transactions (fingerprint)')
+
+
+@migration(10, 'change_log_trim')
+def change_log_trim(db, conn):
+    """Giới hạn kích thước transaction_changes bằng trigger.
+
+    Mỗi lệnh sửa/xóa giao dịch thêm một mục vào change log; trigger bỏ các mục
+    cũ hơn CHANGE_LOG_KEEP mục gần nhất ngay trong giao dịch ghi đó. Loader đã
+    đọc tới trước phần bị bỏ thì nạp lại toàn bộ (TransactionLoader._apply_changes).
+    """
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_transaction_changes_trim
+        AFTER INSERT ON transaction_changes WHEN NEW.seq % {CHANGE_LOG_TRIM_EVERY} = 0 BEGIN
+            DELETE FROM transaction_changes WHERE seq <= NEW.seq - {CHANGE_LOG_KEEP};
+        END
+    ''')
+    conn.execute('''
+        DELETE FROM transaction_changes
+        WHERE seq <= (SELECT COALESCE(MAX(seq), 0) FROM transaction_changes) - ?
+    ''', (CHANGE_LOG_KEEP,))
@@ -0,0 +1,111 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+# Tần suất của nhắc nhở lặp lại và quy tắc giao dịch định kỳ
+FREQUENCIES = {
+    'daily': 'Hàng ngày',
+    'weekly': 'Hàng tuần',
+    'monthly': 'Hàng tháng',
+    'yearly': 'Hàng năm',
+}
+# Chu kỳ lặp của nhắc nhở; 'none' là nhắc nhở một lần
+RECURRENCES = {'none': 'Một lần', **FREQUENCIES}
+# Số ngày tối đa của một chu kỳ, dùng để nhảy gần tới ngày bắt đầu
+_MAX_PERIOD_DAYS = {'daily': 1, 'weekly': 7, 'monthly': 31, 'yearly': 366}
+
+
+def to_date(value):
+    # Nhận date, datetime, pandas Timestamp hoặc chuỗi 'YYYY-MM-DD'
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def day_number(value):
+    """Số ngày (ordinal, 0001-01-01 = 1) dùng làm khóa sắp xếp kiểu số nguyên.
+
+    Trong SQLite: ``CAST(julianday(d) - 1721424.5 AS INTEGER)``.
+    """
+    return to_date(value).toordinal()
+
+
+def from_day_number(day):
+    return date.fromordinal(day)
+
+
+def today_number():
+    return date.today().toordinal()
+
+
+def add_months(value, months, day=None):
+    # Giữ ngày trong tháng (hoặc ``day``), lùi về ngày cuối tháng nếu tháng đích ngắn hơn (31/1 -> 28/2)
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day or value.day, calendar.monthrange(year, month)[1]))
+
+
+def _nth_occurrence(anchor, recurrence, n, day_of_month=None):
+    if recurrence == 'daily':
+        return anchor + timedelta(days=n)
+    if recurrence == 'weekly':
+        return anchor + timedelta(weeks=n)
+    if recurrence == 'monthly':
+        return add_months(anchor, n, day_of_month)
+    if recurrence == 'yearly':
+        return add_months(anchor, 12 * n, day_of_month)
+    raise ValueError(f'Chu kỳ lặp không hợp lệ: {recurrence}')
+
+
+def occurrences(anchor_day, recurrence, start_day, end_day=None, interval=1, day_of_month=None):
+    """Sinh lần lượt (lười) các ngày đến hạn trong [start_day, end_day] dạng day number.
+
+    Chuỗi bắt đầu từ chu kỳ chứa ``anchor_day``, cách nhau ``interval`` chu kỳ;
+    với 'monthly'/'yearly', ``day_of_month`` (nếu có) thay cho ngày của anchor.
+    Không sinh ngày trước anchor_day; end_day=None sinh vô hạn.
+    """
+    if recurrence == 'none':
+        if anchor_day >= start_day and (end_day is None or anchor_day <= end_day):
+            yield anchor_day
+        return
+    anchor = from_day_number(anchor_day)
+    start_day = max(start_day, anchor_day)
+    # Nhảy gần tới start_day thay vì lặp từ đầu chuỗi
+    n = max(0, (start_day - anchor_day) // (_MAX_PERIOD_DAYS[recurrence] * interval) - 1)
+    while True:
+        day = _nth_occurrence(anchor, recurrence, n * interval, day_of_month).toordinal()
+        n += 1
+        if day < start_day:
+            continue
+        if end_day is not None and day > end_day:
+            return
+        yield day
+
+
+def next_occurrence(anchor_day, recurrence, start_day, interval=1, day_of_month=None):
+    # Lần đến hạn đầu tiên từ start_day trở đi, None nếu không còn
+    return next(occurrences(anchor_day, recurrence, start_day,
+                            interval=interval, day_of_month=day_of_month), None)
+
+
+# Kỳ ngân sách
+BUDGET_PERIODS = {
+    'weekly': 'Hàng tuần',
+    'monthly': 'Hàng tháng',
+    'yearly': 'Hàng năm',
+}
+
+
+def period_bounds(period, value):
+    # (ngày đầu, ngày cuối) của kỳ chứa ``value``; tuần bắt đầu từ thứ Hai
+    value = to_date(value)
+    if period == 'weekly':
+        start = value - timedelta(days=value.weekday())
+        return start, start + timedelta(days=6)
+    if period == 'monthly':
+        start = value.replace(day=1)
+        return start, add_months(start, 1) - timedelta(days=1)
+    if period == 'yearly':
+        return date(value.year, 1, 1), date(value.year, 12, 31)
+    raise ValueError(f'Kỳ ngân sách không hợp lệ: {period}')
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from database import Database
+
+DEFAULT_DB_NAME = 'finance.db'
+MAX_OPEN_SHARDS = 32
+
+
+def user_key(username):
+    # Tên đăng nhập chuẩn hóa: không phân biệt hoa thường và khoảng trắng hai đầu
+    return username.strip().casefold()
+
+
+class ShardRouter:
+    """Ánh xạ mỗi người dùng tới một file SQLite riêng.
+
+    File nằm ở ``base_dir/<2 ký tự đầu của hash>/user_<hash>.db`` để thư mục
+    không quá nhiều file. Các ``Database`` đang mở được giữ trong cache LRU
+    tối đa ``max_open`` shard; shard bị loại được ``close()`` (đóng kết nối
+    rảnh, ghi nốt hàng đợi rồi dừng thread write-behind, bỏ DataFrame thường
+    trú) và vẫn dùng tiếp được nếu còn phiên đang giữ vì pool và thread ghi
+    được tạo lại khi cần.
+
+    base_dir=None: mọi người dùng dùng chung ``finance.db`` (chạy một người dùng).
+    """
+
+    def __init__(self, base_dir=None, max_open=MAX_OPEN_SHARDS, **db_options):
+        self.base_dir = base_dir
+        self.max_open = max_open
+        self.db_options = db_options
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.evicted = 0
+
+    def shard_path(self, username):
+        if self.base_dir is None:
+            return DEFAULT_DB_NAME
+        digest = hashlib.sha256(user_key(username).encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.base_dir, digest[:2], f'user_{digest}.db')
+
+    def get(self, username):
+        path = self.shard_path(username)
+        with self._lock:
+            db = self._open.get(path)
+            if db is not None:
+                self._open.move_to_end(path)
+                return db
+        # Mở shard ngoài khóa để người dùng khác không phải chờ tạo bảng
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        db = Database(path, **self.db_options)
+        db.load_categories()
+        evicted = []
+        with self._lock:
+            existing = self._open.get(path)
+            if existing is not None:
+                # Một phiên khác vừa mở cùng shard
+                evicted.append(db)
+                db = existing
+            else:
+                self._open[path] = db
+                self.opened += 1
+            self._open.move_to_end(path)
+            while len(self._open) > self.max_open:
+                evicted.append(self._open.popitem(last=False)[1])
+                self.evicted += 1
+        for handle in evicted:
+            handle.close()
+        return db
+
+    def close(self):
+        with self._lock:
+            handles = list(self._open.values())
+            self._open.clear()
+        for db in handles:
+            db.close()
+
+    def stats(self):
+        with self._lock:
+            return {'open': len(self._open), 'max_open': self.max_open,
+                    'opened': self.opened, 'evicted': self.evicted}
+
+
+# Một router cho mỗi thư mục shard, dùng chung giữa các phiên Streamlit
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(base_dir=None, **options):
+    with _routers_lock:
+        router = _routers.get(base_dir)
+        if router is None:
+            router = _routers[base_dir] = ShardRouter(base_dir, **options)
+        return router
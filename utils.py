@@ -1,10 +1,59 @@
-import plotly.express as px
+import functools
+import hashlib
+import inspect
+import numpy as np
 import pandas as pd
+from cache import figure_cache
+from instrumentation import instrumented
+
+# Số điểm tối đa của biểu đồ xu hướng và ngưỡng chuyển sang trace WebGL
+TREND_MAX_POINTS = 1500
+WEBGL_MIN_POINTS = 1000
+TREND_RESOLUTIONS = {
+    'D': 'ngày',
+    'W': 'tuần',
+    'M': 'tháng',
+}
+
+def content_hash(data):
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(data, pd.DataFrame):
+        digest.update(repr(list(data.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    else:
+        digest.update(repr(sorted(data.items())).encode())
+    return digest.hexdigest()
+
+def memoized_figure(name):
+    # Cache JSON của Figure theo hash nội dung dữ liệu và tham số (kể cả tham số vị trí);
+    # mỗi lần gọi dựng một Figure mới từ JSON nên trang gọi sửa Figure trả về không ảnh
+    # hưởng bản trong cache
+    def decorator(build):
+        signature = inspect.signature(build)
+
+        @functools.wraps(build)
+        def wrapper(*args, **kwargs):
+            import plotly.io as pio
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            (_, data), *params = bound.arguments.items()
+            key = (name, content_hash(data), tuple(params))
+            payload = figure_cache.get_or_compute(key, None, lambda: build(*args, **kwargs).to_json())
+            return pio.from_json(payload)
+        wrapper.uncached = build
+        return wrapper
+    return decorator
 
 def format_currency(amount):
     return "{:,.0f} đ".format(amount) if amount >= 0 else "-{:,.0f} đ".format(abs(amount))
 
+@memoized_figure('expense_by_category')
+@instrumented('utils.create_expense_by_category_chart')
 def create_expense_by_category_chart(category_summary):
+    # Plotly được import khi dựng biểu đồ đầu tiên (~0.4s) thay vì khi app khởi động
+    import plotly.express as px
+
     if not category_summary:
         return px.pie(names=['Không có dữ liệu'], values=[1])
     
@@ -16,18 +65,74 @@ def create_expense_by_category_chart(category_summary):
     fig.update_traces(textinfo='percent+label+value', texttemplate='%{label}<br>%{value:,.0f} đ<br>(%{percent})')
     return fig
 
-def create_expense_trend_chart(transactions):
-    if transactions.empty:
+def resample_daily(days, amounts, resolution):
+    # Gom chuỗi theo ngày thành tuần/tháng trên khóa số nguyên, không đổi sang chuỗi
+    # days: mảng datetime64[D]; trả về (mốc thời gian datetime64[D], tổng tiền)
+    if resolution == 'D':
+        return days, amounts
+    if resolution == 'W':
+        # 1970-01-01 là thứ Năm: (ngày + 3) // 7 cho tuần bắt đầu từ thứ Hai
+        keys = (days.astype('int64') + 3) // 7
+        starts = (keys * 7 - 3).astype('datetime64[D]')
+    else:
+        keys = days.astype('datetime64[M]').astype('int64')
+        starts = keys.astype('datetime64[M]').astype('datetime64[D]')
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return starts[first], np.bincount(inverse, weights=amounts, minlength=len(unique_keys))
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: giữ hình dạng chuỗi với tối đa threshold điểm
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    xs = x.astype('float64')
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = xs[next_start:max(next_end, next_start + 1)].mean()
+        avg_y = y[next_start:max(next_end, next_start + 1)].mean()
+        area = np.abs((xs[previous] - avg_x) * (y[start:end] - y[previous])
+                      - (xs[previous] - xs[start:end]) * (avg_y - y[previous]))
+        previous = start + int(area.argmax())
+        selected[i + 1] = previous
+    return x[selected], y[selected]
+
+def choose_trend_resolution(days, max_points=TREND_MAX_POINTS):
+    # Chọn độ phân giải mịn nhất mà số điểm không vượt quá max_points
+    span = int((days[-1] - days[0]).astype('int64')) + 1
+    if len(days) <= max_points:
+        return 'D'
+    if span // 7 + 1 <= max_points:
+        return 'W'
+    return 'M'
+
+@memoized_figure('expense_trend')
+@instrumented('utils.create_expense_trend_chart')
+def create_expense_trend_chart(daily_expenses, resolution='auto', max_points=TREND_MAX_POINTS):
+    # daily_expenses: tổng chi theo ngày (cột ngay datetime64, so_tien) từ Database.get_daily_expenses
+    # resolution: 'auto', 'D', 'W' hoặc 'M'; chuỗi dài hơn max_points được giảm mẫu bằng LTTB
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    if daily_expenses.empty:
         return px.line(title='Không có dữ liệu')
     
-    df = transactions.copy()
-    df['ngay'] = pd.to_datetime(df['ngay'])
-    df = df[df['loai'] == 'Chi']
-    df = df.groupby(df['ngay'].dt.to_period('D').astype(str))['so_tien'].sum().reset_index()
+    days = daily_expenses['ngay'].to_numpy().astype('datetime64[D]')
+    amounts = daily_expenses['so_tien'].to_numpy(dtype='float64')
+    if resolution == 'auto':
+        resolution = choose_trend_resolution(days, max_points)
+    x, y = resample_daily(days, amounts, resolution)
+    x, y = lttb(x, y, max_points)
     
-    fig = px.line(df, x='ngay', y='so_tien', 
-                 title='Xu hướng chi tiêu theo ngày',
-                 labels={'ngay': 'Ngày', 'so_tien': 'Số tiền (đ)'})
+    trace = go.Scattergl if len(x) >= WEBGL_MIN_POINTS else go.Scatter
+    fig = go.Figure(trace(x=x, y=y, mode='lines', name='Chi tiêu',
+                          hovertemplate='%{x|%Y-%m-%d}<br>%{y:,.0f} đ<extra></extra>'))
+    fig.update_layout(title=f'Xu hướng chi tiêu theo {TREND_RESOLUTIONS[resolution]}',
+                      xaxis_title='Ngày', yaxis_title='Số tiền (đ)')
     fig.update_xaxes(tickformat='%Y-%m-%d')
     fig.update_yaxes(tickprefix='', ticksuffix=' đ')
-    return fig
\ No newline at end of file
+    return fig